@@ -0,0 +1,83 @@
+import timeit
+import tracemalloc
+import numpy as np
+import cv2 as cv
+import fixtures
+import preprocess
+import preview
+
+# Compares the memory allocated per frame by the original preprocessing, which creates new images for every step,
+# with preprocess.Preprocessor, which writes every step into buffers that are kept between frames.
+# NumPy reports the images it allocates for OpenCV to tracemalloc, so the peak shows the images allocated during a frame.
+
+LOW, HIGH = (0, 0, 45), (180, 70, 160)
+
+def main():
+  frames = [frame for frame, balls in fixtures.Table(16).getFrames(10)]
+  preprocessor = preprocess.Preprocessor()
+  mosaic = preview.Preview(["Output", "Masked frame", "Frame mask", "Color mask"], every=1)
+  throttled = preview.Preview(["Output", "Masked frame", "Frame mask", "Color mask"], every=5)
+  hsvMask, maskedFrame = np.empty(frames[0].shape[:2], np.uint8), np.empty(frames[0].shape, np.uint8)
+  mask = np.empty(frames[0].shape[:2], np.uint8)
+  steps = {
+    "gray": (originalGray, preprocessor.toGray),
+    "color mask": (originalColorMask, lambda frame: preprocessor.getColorMask(frame, 160, mask)),
+    "felt mask": (originalFeltMask, lambda frame: preprocessor.maskRange(frame, LOW, HIGH, hsvMask, maskedFrame)),
+    "image": (originalImage, lambda frame: mosaic.render(frame, (frame, hsvMask, mask))),
+    "image / 5": (originalImage, lambda frame: throttled.render(frame, (frame, hsvMask, mask)))
+  }
+
+  print("step        version     allocated per frame   time")
+  for name, (original, buffered) in steps.items():
+    for version, step in (("original", original), ("buffered", buffered)):
+      allocated = measure(step, frames)
+      duration = min(timeit.repeat(lambda: [step(frame) for frame in frames], number=1, repeat=5)) / len(frames) * 1000
+      print(f"{name:11} {version:9}  {allocated / 1024 / 1024:10.2f} MiB        {duration:6.2f}ms")
+
+# The largest amount of memory allocated during a frame, after a first frame that creates the buffers.
+def measure(step, frames):
+  step(frames[0])
+  tracemalloc.start()
+  allocated = 0
+
+  for frame in frames[1:]:
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    result = step(frame)
+    allocated = max(allocated, tracemalloc.get_traced_memory()[1] - current)
+    # Drop the result so it's not counted in the next frame.
+    del result
+
+  tracemalloc.stop()
+  return allocated
+
+# The original implementations, kept for comparison.
+def originalGray(frame):
+  gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+  gray = cv.pyrDown(gray)
+  return cv.medianBlur(gray, 5)
+
+def originalColorMask(frame):
+  thresh, mask = cv.threshold(frame, 160, 255, cv.THRESH_BINARY)
+  mask = cv.cvtColor(mask, cv.COLOR_BGR2GRAY)
+  thresh, mask = cv.threshold(mask, 230, 255, cv.THRESH_BINARY)
+  return mask
+
+def originalFeltMask(frame):
+  hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+  hsvMask = cv.bitwise_not(cv.inRange(hsv, LOW, HIGH))
+  maskedFrame = cv.bitwise_and(frame, frame, mask = hsvMask)
+  gray = cv.cvtColor(maskedFrame, cv.COLOR_BGR2GRAY)
+  return hsvMask, maskedFrame, cv.medianBlur(gray, 5)
+
+def originalImage(frame):
+  size = 60
+  row1 = np.hstack((cv.resize(frame, (0, 0), None, size / 100, size / 100), cv.resize(frame, (0, 0), None, size / 100, size / 100)))
+  gray = cv.cvtColor(frame[:, :, 0], cv.COLOR_GRAY2BGR)
+  row2 = np.hstack((cv.resize(gray, (0, 0), None, size / 100, size / 100), cv.resize(gray, (0, 0), None, size / 100, size / 100)))
+  return np.vstack((row1, row2))
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,79 @@
+import timeit
+import numpy as np
+import cv2 as cv
+import colors
+
+# Compares the dominant color engines in colors.py with the original cv.kmeans on a full-frame mask,
+# on a frame with balls that are half one color and half another.
+
+def main():
+  cv.setRNGSeed(0)
+  frame, circles, expected = createFrame(16)
+  engines = {
+    "original": OriginalColors(),
+    "kmeans": colors.KMeansColors(),
+    "kmeans subsample 4": colors.KMeansColors(4),
+    "batched": colors.BatchedColors(),
+    "batched subsample 4": colors.BatchedColors(4)
+  }
+  original = engines["original"].getColors(frame, circles)
+
+  print("engine               time      error  difference with original")
+  for name, engine in engines.items():
+    found = engine.getColors(frame, circles)
+    # The error is measured on the first call, the timed calls after it let the batched engine start from its previous result.
+    duration = min(timeit.repeat(lambda: engine.getColors(frame, circles), number=10, repeat=3)) / 10 * 1000
+    print(f"{name:19}  {duration:6.2f}ms  {getError(found, expected):5.1f}  {getError(found, original):5.1f}")
+
+# Create a frame with balls that have a different color on each half, on a noisy table.
+def createFrame(balls: int):
+  rng = np.random.default_rng(0)
+  frame = np.clip(rng.normal((60, 110, 30), 8, (720, 1280, 3)), 0, 255).astype(np.uint8)
+  circles = []
+  expected = []
+
+  for i in range(balls):
+    x, y, radius = 80 + (i % 8) * 150, 150 + (i // 8) * 300, int(rng.integers(14, 40))
+    color1, color2 = rng.integers(0, 256, 3), rng.integers(0, 256, 3)
+    cv.ellipse(frame, (x, y), (radius, radius), 0, 90, 270, color1.tolist(), -1)
+    cv.ellipse(frame, (x, y), (radius, radius), 0, 270, 450, color2.tolist(), -1)
+    circles.append((x, y, radius))
+    expected.append((color1, color2))
+
+  return frame, np.array(circles), np.array(expected)
+
+# The mean absolute difference per channel between 2 sets of colors, the order of the 2 colors doesn't matter.
+def getError(found, expected):
+  straight = np.abs(found - expected).mean((1, 2))
+  swapped = np.abs(found[:, ::-1] - expected).mean((1, 2))
+  return np.minimum(straight, swapped).mean()
+
+# The original implementation, kept for comparison.
+class OriginalColors:
+  def getColors(self, frame, circles):
+    return np.array([self.getCircleColors(frame, circle) for circle in circles.tolist()])
+
+  def getCircleColors(self, frame, circle):
+    # Create a mask the same size as our frame and fill it with zeros (black).
+    mask = np.zeros(frame.shape, np.uint8)
+    # Draw our circle in white on the mask.
+    cv.circle(mask, (circle[0], circle[1]), circle[2], (255, 255, 255, 255), -1)
+    # Mask the frame.
+    roi = cv.bitwise_and(frame, mask)
+    # Reshape all pixels to be in a single array.
+    roi = roi.reshape((-1, 3))
+    # Remove all pixels that are totally black.
+    roi = roi[~np.all(roi == 0, axis=1)]
+    # Convert to float.
+    roi = np.float32(roi)
+    # Define the criteria and get the kmeans.
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 1, 1.0)
+    ret, label, center = cv.kmeans(roi, 2, None, criteria, 1, cv.KMEANS_PP_CENTERS)
+
+    # Return the found colors as a list of BGR integers.
+    return list(map(lambda color: [round(color[0]), round(color[1]), round(color[2])], center))
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,67 @@
+import importlib
+import timeit
+import numpy as np
+import util
+
+# Compares the grouping of the circle buffer in pool-ball-detection.py with the original nested loop.
+poolBall = importlib.import_module("pool-ball-detection")
+
+def main():
+  print("balls  original  vectorized  speedup")
+
+  for balls in [8, 16, 32, 64]:
+    fillBuffer(balls)
+
+    # Both implementations have to find exactly the same circles.
+    expected = [(c["x"], c["y"], c["radius"]) for c in getCirclesOriginal()]
+    actual = list(map(tuple, util.getRows(poolBall.getCircles()).tolist()))
+    if expected != actual:
+      util.errorAndExit(f"Different circles for {balls} balls")
+
+    original = min(timeit.repeat(getCirclesOriginal, number=20, repeat=5)) / 20 * 1000
+    vectorized = min(timeit.repeat(poolBall.getCircles, number=20, repeat=5)) / 20 * 1000
+    print(f"{balls:5}  {original:6.2f}ms  {vectorized:8.2f}ms  {original / vectorized:6.1f}x")
+
+# Fill the circle buffer with a table of balls that jitter a bit, with some balls missing in some frames.
+def fillBuffer(balls: int):
+  rng = np.random.default_rng(balls)
+  # Put every ball in its own cell of a 30 pixel grid so they don't overlap.
+  cells = rng.choice(40 * 20, balls, replace=False)
+  positions = np.stack((40 + cells % 40 * 30, 40 + cells // 40 * 30), 1)
+  poolBall.reset()
+
+  for frame in range(poolBall.detectedCircles.maxlen):
+    jitter = rng.integers(-2, 3, (balls, 2))
+    circles = np.hstack((positions + jitter, rng.integers(13, 16, (balls, 1))))
+    visible = rng.random(balls) > 0.05
+    poolBall.detectedCircles.append(np.int32(circles[visible]))
+
+# The original implementation, kept for comparison.
+def getCirclesOriginal():
+  if len(poolBall.detectedCircles) != poolBall.detectedCircles.maxlen: return []
+  groupedCircles = []
+  circles = []
+
+  # Group circles that are within a few pixels of each other.
+  for circle in poolBall.detectedCircles:
+    for c in circle.tolist():
+      existingCircle = next((x for x in groupedCircles if util.inRange(x[0][0], c[0], 10) & util.inRange(x[0][1], c[1], 6)), None)
+
+      if existingCircle is None:
+        groupedCircles.append([c])
+      else:
+        existingCircle.append(c)
+
+  # Get the average of the group and build the circle for drawing.
+  for group in groupedCircles:
+    if len(group) != poolBall.detectedCircles.maxlen: continue
+    mean = np.mean(group, 0, np.int_)
+
+    circles.append({ "x": mean[0], "y": mean[1], "radius": mean[2], "colors": [] })
+
+  return circles
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,55 @@
+import time
+import numpy as np
+import fixtures
+import hough
+import preprocess
+
+# Compares the single scale HoughCircles with the coarse to fine search of hough.findCirclesCoarseToFine
+# and the tiled search of hough.findCirclesTiled, on synthetic pool table frames with known balls.
+# circle: the grayscale frame at half size with the parameters of the circle detection scripts.
+# pool-ball: the masked frame at full size with the parameters of pool-ball-detection.py.
+
+POOL_BALL = { "dp": 1, "minDist": 25, "param1": 140, "param2": 14, "minRadius": 12, "maxRadius": 16 }
+
+def main():
+  print("setup       resolution  levels  tiles      time  recall  precision  error")
+
+  for resolution in ((1280, 720), (1920, 1080), (3840, 2160)):
+    frames = fixtures.Table(16, resolution).getFrames(20)
+    preprocessor = preprocess.Preprocessor()
+    # Copy the preprocessed frames, the preprocessor reuses its buffers.
+    setups = {
+      "circle": ([preprocessor.toGray(frame).copy() for frame, balls in frames], hough.DEFAULT, 2),
+      "pool-ball": ([preprocessor.maskRange(frame, (0, 0, 45), (180, 70, 160))[2].copy() for frame, balls in frames], POOL_BALL, 1)
+    }
+
+    for name, (images, params, ratio) in setups.items():
+      for levels, tiles in [(levels, 0) for levels in range(4)] + [(0, 2), (0, 4)]:
+        duration, found = run(images, params, levels, tiles)
+        recall, precision, error = np.mean([getScores(circles * ratio, balls) for circles, (frame, balls) in zip(found, frames)], 0)
+        print(f"{name:10}  {resolution[0]:4}x{resolution[1]:<4}  {levels:6}  {tiles:5}  {duration:6.2f}ms  {recall:6.2f}  {precision:9.2f}  {error:5.2f}")
+
+# Find the circles in every image, returns the average time per image and the circles.
+def run(images, params, levels: int, tiles: int = 0):
+  found = []
+  begin = time.perf_counter()
+
+  for image in images:
+    found.append(hough.findCircles(image, params, levels, tiles))
+
+  return (time.perf_counter() - begin) / len(images) * 1000, found
+
+# The part of the balls that was found, the part of the circles that is a ball and the average distance
+# between a found ball and its circle. A ball is found when a circle is within its radius.
+def getScores(circles, balls):
+  if len(circles) == 0: return 0.0, 0.0, 0.0
+
+  distances = np.hypot(balls[:, None, 0] - circles[None, :, 0], balls[:, None, 1] - circles[None, :, 1])
+  closest = distances.min(1)
+  found = closest <= balls[:, 2]
+  return found.mean(), (distances.min(0) <= balls[0, 2]).mean(), closest[found].mean() if found.any() else 0.0
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
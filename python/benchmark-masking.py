@@ -0,0 +1,39 @@
+import time
+import timeit
+import numpy as np
+import fixtures
+import preprocess
+
+# Compares masking out the felt with the HSV conversion and range check of every frame with the lookup table
+# of preprocess.RangeLookup, on synthetic pool table frames with the default HSV slider values of pool-ball-detection.py.
+
+LOW, HIGH = (0, 0, 45), (180, 70, 160)
+
+def main():
+  lookup = preprocess.RangeLookup()
+  begin = time.perf_counter()
+  lookup.build(LOW, HIGH)
+  print(f"first build {(time.perf_counter() - begin) * 1000:.0f}ms, ", end="")
+  begin = time.perf_counter()
+  lookup.build(LOW, (180, 70, 150))
+  print(f"rebuild after a slider change {(time.perf_counter() - begin) * 1000:.0f}ms")
+  lookup.build(LOW, HIGH)
+
+  print("resolution  version     time  same result")
+  for resolution in ((640, 360), (1280, 720), (1920, 1080)):
+    frames = [frame for frame, balls in fixtures.Table(16, resolution).getFrames(10)]
+    chain, table = preprocess.Preprocessor(), preprocess.Preprocessor()
+    versions = {
+      "chain": lambda frame: chain.maskRange(frame, LOW, HIGH),
+      "lookup": lambda frame: table.maskRange(frame, LOW, HIGH, lookup=lookup)
+    }
+    same = all(np.array_equal(versions["chain"](frame)[2], versions["lookup"](frame)[2]) for frame in frames)
+
+    for name, version in versions.items():
+      duration = min(timeit.repeat(lambda: [version(frame) for frame in frames], number=1, repeat=5)) / len(frames) * 1000
+      print(f"{resolution[0]:4}x{resolution[1]:<4}   {name:7}  {duration:6.2f}ms  {same}")
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,61 @@
+import argparse
+import time
+import numpy as np
+import fixtures
+import headless
+import util
+
+# Times every detector on synthetic pool table frames and reports the frames per second,
+# the part of the balls that was found and the time per stage.
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the circle detectors on synthetic frames.")
+  parser.add_argument("--detectors", default=",".join(headless.DETECTORS.keys()), help="Comma separated detectors to run.")
+  parser.add_argument("--resolutions", default="1280x720", help="Comma separated resolutions as widthxheight.")
+  parser.add_argument("--balls", default="16", help="Comma separated numbers of balls.")
+  parser.add_argument("--noise", type=float, default=4, help="The standard deviation of the camera noise.")
+  parser.add_argument("--frames", type=int, default=60, help="The number of frames per run.")
+  args = parser.parse_args()
+
+  print(f"{'detector':16} {'resolution':>10} {'balls':>5} {'fps':>7} {'recall':>6}  stages (p50 ms)")
+
+  for resolution in args.resolutions.split(","):
+    for balls in map(int, args.balls.split(",")):
+      frames = fixtures.Table(balls, fixtures.parseResolution(resolution), args.noise).getFrames(args.frames)
+
+      for name in args.detectors.split(","):
+        fps, recall, profile = run(headless.loadDetector(name), frames)
+        stages = "  ".join(f"{stage} {percentiles[0]:.2f}" for stage, percentiles in profile.items())
+        print(f"{name:16} {resolution:>10} {balls:5} {fps:7.1f} {recall:6.2f}  {stages}")
+
+# Run a detector over frames, returns the frames per second, the recall and the profile of the stages.
+def run(detector, frames):
+  if hasattr(detector, "reset"):
+    detector.reset()
+  util.enableProfiling(report=False)
+  found = []
+
+  begin = time.perf_counter()
+  for frame, balls in frames:
+    # Copy the frame, like a frame fresh from the camera.
+    found.append(detector.detect(frame.copy()))
+  duration = time.perf_counter() - begin
+
+  # Skip the frames a detector needs to fill its buffers.
+  warmup = getattr(detector, "WARMUP", 0)
+  recall = np.mean([getRecall(circles, balls) for circles, (frame, balls) in zip(found[warmup:], frames[warmup:])])
+  return len(frames) / duration, recall, util.getProfile()
+
+# The part of the balls that has a detected circle within its radius.
+def getRecall(circles, balls):
+  if len(balls) == 0: return 1.0
+  if len(circles) == 0: return 0.0
+
+  detected = np.stack((circles["x"], circles["y"]), 1).astype(float)
+  distances = np.hypot(balls[:, None, 0] - detected[None, :, 0], balls[:, None, 1] - detected[None, :, 1])
+  return np.mean(distances.min(1) <= balls[:, 2])
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+import collections
+import threading
+import util
+
+# Drop policies for the frame buffer.
+# LATEST: Keep only the newest frames and drop the rest, used for live cameras.
+# LOSSLESS: Never drop a frame and pause reading when the buffer is full, used for video files.
+LATEST = "latest"
+LOSSLESS = "lossless"
+
+
+# Reads frames on a background thread so decoding and processing can overlap.
+# Has the same read/release interface as the VideoCapture returned by util.openInput.
+class ThreadedInput:
+  def __init__(self, source, props=[], policy=None, size: int = 2):
+    # Cameras are identified by a number, everything else is a file or stream.
+    if policy is None:
+      policy = LATEST if isinstance(source, int) else LOSSLESS
+
+    self.input = util.openInput(source, props)
+    self.policy = policy
+    self.frames = collections.deque(maxlen=size if policy == LATEST else None)
+    self.size = size
+    self.dropped = 0
+    self.stopped = False
+    self.condition = threading.Condition()
+    self.thread = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+
+  def _run(self):
+    while not self.stopped:
+      grabbed, frame = self.input.read()
+
+      with self.condition:
+        if not grabbed:
+          self.stopped = True
+        elif self.policy == LATEST:
+          # The deque has a max length, so the oldest frame falls out.
+          if len(self.frames) == self.size:
+            self.dropped += 1
+          self.frames.append(frame)
+        else:
+          # Wait until the consumer made room.
+          while len(self.frames) >= self.size and not self.stopped:
+            self.condition.wait()
+          self.frames.append(frame)
+
+        self.condition.notify_all()
+
+  def read(self):
+    with self.condition:
+      # Wait for a new frame or the end of the stream.
+      while len(self.frames) == 0 and not self.stopped:
+        self.condition.wait()
+
+      if len(self.frames) == 0:
+        return False, None
+
+      if self.policy == LATEST:
+        # Only the newest frame matters for live input, skip the older ones.
+        frame = self.frames.pop()
+        self.dropped += len(self.frames)
+        self.frames.clear()
+      else:
+        frame = self.frames.popleft()
+
+      self.condition.notify_all()
+      return True, frame
+
+  def isOpened(self) -> bool:
+    return self.input.isOpened()
+
+  def get(self, prop):
+    return self.input.get(prop)
+
+  def release(self):
+    with self.condition:
+      self.stopped = True
+      self.condition.notify_all()
+
+    self.thread.join()
+    self.input.release()
+
+
+def openInput(input, props=[], policy=None, size: int = 2) -> ThreadedInput:
+  return ThreadedInput(input, props, policy, size)
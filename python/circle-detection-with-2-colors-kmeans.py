@@ -1,7 +1,26 @@
-import numpy as np
 import cv2 as cv
+import capture
+import colors
+import hough
+import preprocess
+import tracker
 import util
 
+# The engine that finds the 2 colors of the circles, see colors.py.
+# Use colors.KMeansColors() for a cv.kmeans call per circle.
+COLOR_ENGINE = colors.BatchedColors()
+
+# Number of frames needed for the colors to match a run from the start when starting halfway a video.
+# The batched engine starts from the colors it found for the circles of the previous frame,
+# after a few frames the colors no longer depend on where it started.
+WARMUP = 5
+
+# Find the circles on the image halved this many times first and then only search around them, 0 searches the whole image.
+COARSE_LEVELS = 0
+
+# Keeps the buffers of the preprocessing between frames.
+preprocessor = preprocess.Preprocessor()
+
 def main():
   util.setWindowName("Circle detection | OpenCV Demo")
   process()
@@ -10,100 +29,90 @@ def process():
   # Get a video stream from the webcam.
   # Play around with this for the correct number,
   # if you only have one webcam, it will be 0.
-  input = util.openInput(1)
+  input = capture.openInput(1)
+  # Follow the circles over the frames so only small parts of the frame have to be searched.
+  circleTracker = tracker.CircleTracker(levels=COARSE_LEVELS)
 
   # Loop for processing the frames.
   while True:
     begin = util.millis()
-    grabbed, frame = input.read()
+    with util.stage("capture"):
+      grabbed, frame = input.read()
 
     # Check if we have a valid frame.
     if not grabbed:
       print("Can't receive frame, exiting..")
       break
 
-    # Prepare the frame.
-    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-    gray = cv.pyrDown(gray)
-    gray = cv.medianBlur(gray, 5)
-
-    # Detect circles using HoughCircles.
-    # Params:
-    # 1: The input image.
-    # 2: The type of detection, only HOUGH_GRADIENT is supported.
-    # 3: dp - Inverse ratio of the accumulator resolution to the image resolution, 1 = same as input, 2 = half the input.
-    # 4: minDist - Minimum distance between the centers of the circles.
-    # 5 (param1): highThreshold - High threshold for the Canny edge detector (low is half).
-    # 6 (param2): accumulatorThreshold - Accumulator threshold for the circle centers, smaller means more false circle may be detected.
-    #             Circles with the largest accumulator will be returned first.
-    # 7 (minRadius): Minimum circle radius.
-    # 8 (maxRadius): Maximum cirlce radius.
-    circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, 1, 35, param1=150, param2=25, minRadius=5, maxRadius=45)
+    # Detect the circles.
+    circles = detect(frame, circleTracker)
 
     # Draw the circles.
-    if not circles is None:
-      # Get the circles.
-      circles = getCircles(circles, util.getRatio(frame, gray))
-      # Get the first color.
-      for circle in circles:
-        circle["colors"] = getCircleColors(frame, circle)
-      # Draw the circles.
+    with util.stage("draw"):
       drawCircles(frame, circles)
     
-    # Draw the FPS.
+    # Draw the FPS and the stage timings when profiling, the quality scheduler adapts to the same time.
+    duration = util.millis() - begin
     util.drawFPS(frame, duration)
+    util.updateQuality(duration)
+    util.drawProfile(frame)
+
+    # Record the frame and the circles when recording.
+    with util.stage("record"):
+      util.record(frame, circles)
 
     # Show the frame.
-    if not util.show(frame):
-      break
+    with util.stage("display"):
+      if not util.show(frame):
+        break
 
   # Cleanup.
   input.release()
-  cv.destroyAllWindows()
-
-def getCircles(circles, ratio):
-  # Format and round the detected circles so we can loop.
-  circles = np.uint16(np.around(circles))
-  foundCircles = []
-
-  for circle in circles[0, :]:
-    # Get the postion and dimension.
-    x = circle[0] * ratio
-    y = circle[1] * ratio
-    radius = circle[2] * ratio
-
-    foundCircles.append({ "x": x, "y": y, "radius": radius, "colors": [] })
-
-  return foundCircles
-
-def getCircleColors(frame, circle):
-  # Create a mask the same size as our frame and fill it with zeros (black).
-  mask = np.zeros(frame.shape, np.uint8)
-  # Draw our circle in white on the mask.
-  cv.circle(mask, (circle["x"], circle["y"]), circle["radius"], (255, 255, 255, 255), -1)
-  # Mask the frame.
-  roi = cv.bitwise_and(frame, mask)
-  # Reshape all pixels to be in a single array.
-  roi = roi.reshape((-1, 3))
-  # Remove all pixels that are totally black.
-  roi = roi[~np.all(roi == 0, axis=1)]
-  # Convert to float.
-  roi = np.float32(roi)
-  # Define the criteria and get the kmeans.
-  criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 1, 1.0)
-  ret, label, center = cv.kmeans(roi, 2, None, criteria, 1, cv.KMEANS_PP_CENTERS)
-  
-  # Return the found colors as a list of BGR integers.
-  return list(map(lambda color: [round(color[0]), round(color[1]), round(color[2])], center))
+  util.closeWindows()
+
+# Forget the colors of the previous frame, for example before processing another part of a video.
+def reset():
+  COLOR_ENGINE.reset()
+
+# Detect the circles in a frame without drawing anything.
+# With a tracker only the area around the circles of the previous frames is searched.
+def detect(frame, circleTracker=None):
+  # Prepare the frame.
+  gray = preprocessor.toGray(frame)
+
+  # The quality scheduler can search coarser to keep up with the target frame rate.
+  quality = util.getQuality()
+  levels = max(COARSE_LEVELS, quality["levels"])
+
+  # Detect circles using HoughCircles with the parameters in hough.DEFAULT, tuner.py searches better ones.
+  with util.stage("hough"):
+    if circleTracker is not None:
+      # The full searches of the tracker follow the quality too.
+      circleTracker.levels = levels
+      circles = circleTracker.update(gray)
+    else:
+      circles = hough.toHoughCircles(hough.findCircles(gray, hough.DEFAULT, levels))
+
+  if circles is None: return util.toCircles(None)
+  circles = util.toCircles(circles, util.getRatio(frame, gray))
+
+  if circleTracker is not None:
+    circles["id"] = circleTracker.ids
+
+  with util.stage("colors"):
+    # Get the colors.
+    util.setColors(circles, COLOR_ENGINE.getColors(frame, util.getRows(circles), quality["subsample"]))
+
+  return circles
 
 
 ## DRAWING
 def drawCircles(frame, circles):
-  for circle in circles:
+  for x, y, radius, circleColors in util.toTuples(circles):
     # Draw the first color on the frame.
-    cv.ellipse(frame, (circle["x"], circle["y"]), (circle["radius"], circle["radius"]), 0, 90, 270, circle["colors"][0], 4)
+    cv.ellipse(frame, (x, y), (radius, radius), 0, 90, 270, circleColors[0], 4)
     # Draw the second color on the frame.
-    cv.ellipse(frame, (circle["x"], circle["y"]), (circle["radius"], circle["radius"]), 0, 270, 450, circle["colors"][1], 4)
+    cv.ellipse(frame, (x, y), (radius, radius), 0, 270, 450, circleColors[1], 4)
 
 
 # Run the main function if the file is run as a script.
@@ -1,7 +1,16 @@
-import numpy as np
 import cv2 as cv
+import capture
+import hough
+import preprocess
+import tracker
 import util
 
+# Find the circles on the image halved this many times first and then only search around them, 0 searches the whole image.
+COARSE_LEVELS = 0
+
+# Keeps the buffers of the preprocessing between frames.
+preprocessor = preprocess.Preprocessor()
+
 def main():
   util.setWindowName("Circle detection | OpenCV Demo")
   process()
@@ -10,62 +19,77 @@ def process():
   # Get a video stream from the webcam.
   # Play around with this for the correct number,
   # if you only have one webcam, it will be 0.
-  input = util.openInput(1)
+  input = capture.openInput(1)
+  # Follow the circles over the frames so only small parts of the frame have to be searched.
+  circleTracker = tracker.CircleTracker(levels=COARSE_LEVELS)
 
   # Loop for processing the frames.
   while True:
     begin = util.millis()
-    grabbed, frame = input.read()
+    with util.stage("capture"):
+      grabbed, frame = input.read()
 
     # Check if we have a valid frame.
     if not grabbed:
       print("Can't receive frame, exiting..")
       break
-    
-    # Prepare the frame.
-    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-    gray = cv.pyrDown(gray)
-    gray = cv.medianBlur(gray, 5)
-
-    # Detect circles using HoughCircles.
-    # Params:
-    # 1: The input image.
-    # 2: The type of detection, only HOUGH_GRADIENT is supported.
-    # 3: dp - Inverse ratio of the accumulator resolution to the image resolution, 1 = same as input, 2 = half the input.
-    # 4: minDist - Minimum distance between the centers of the circles.
-    # 5 (param1): highThreshold - High threshold for the Canny edge detector (low is half).
-    # 6 (param2): accumulatorThreshold - Accumulator threshold for the circle centers, smaller means more false circle may be detected.
-    #             Circles with the largest accumulator will be returned first.
-    # 7 (minRadius): Minimum circle radius.
-    # 8 (maxRadius): Maximum cirlce radius.
-    circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, 1, 35, param1=150, param2=25, minRadius=5, maxRadius=45)
+
+    # Detect the circles.
+    circles = detect(frame, circleTracker)
 
     # Draw the circles.
-    if not circles is None:
-      drawCircles(frame, circles, util.getRatio(frame, gray))
+    with util.stage("draw"):
+      drawCircles(frame, circles)
     
-    # Draw the FPS.
-    util.drawFPS(frame, util.millis() - begin)
+    # Draw the FPS and the stage timings when profiling, the quality scheduler adapts to the same time.
+    duration = util.millis() - begin
+    util.drawFPS(frame, duration)
+    util.updateQuality(duration)
+    util.drawProfile(frame)
+
+    # Record the frame and the circles when recording.
+    with util.stage("record"):
+      util.record(frame, circles)
 
     # Show the frame.
-    if not util.show(frame):
-      break
+    with util.stage("display"):
+      if not util.show(frame):
+        break
 
   # Cleanup.
   input.release()
-  cv.destroyAllWindows()
+  util.closeWindows()
+
+# Detect the circles in a frame without drawing anything.
+# With a tracker only the area around the circles of the previous frames is searched.
+def detect(frame, circleTracker=None):
+  # Prepare the frame.
+  gray = preprocessor.toGray(frame)
+
+  # The quality scheduler can search coarser to keep up with the target frame rate.
+  quality = util.getQuality()
+  levels = max(COARSE_LEVELS, quality["levels"])
+
+  # Detect circles using HoughCircles with the parameters in hough.DEFAULT, tuner.py searches better ones.
+  with util.stage("hough"):
+    if circleTracker is not None:
+      # The full searches of the tracker follow the quality too.
+      circleTracker.levels = levels
+      circles = circleTracker.update(gray)
+    else:
+      circles = hough.toHoughCircles(hough.findCircles(gray, hough.DEFAULT, levels))
+
+  circles = util.toCircles(circles, util.getRatio(frame, gray))
+
+  if circleTracker is not None:
+    circles["id"] = circleTracker.ids
+
+  return circles
 
 
 ## DRAWING
-def drawCircles(frame, circles, ratio):
-  # Format and round the detected circles so we can loop.
-  circles = np.uint16(np.around(circles))
-
-  for circle in circles[0, :]:
-    # Get the postion and dimension.
-    x = circle[0] * ratio
-    y = circle[1] * ratio
-    radius = circle[2] * ratio
+def drawCircles(frame, circles):
+  for x, y, radius in util.getRows(circles).tolist():
     # Draw the circle on the frame.
     cv.circle(frame, (x, y), radius, (0, 0, 255), 4)
 
@@ -0,0 +1,163 @@
+import functools
+import numpy as np
+import cv2 as cv
+
+## SAMPLING
+# The pixel offsets of a filled circle with the given radius, relative to its center.
+# The disk is drawn with cv.circle so it contains exactly the pixels of a full-frame circle mask.
+@functools.lru_cache(maxsize=None)
+def getDisk(radius: int):
+  mask = np.zeros((radius * 2 + 1, radius * 2 + 1), np.uint8)
+  cv.circle(mask, (radius, radius), radius, 255, -1)
+  y, x = np.nonzero(mask)
+  return y - radius, x - radius
+
+# Get the pixels inside each circle, for all circles with the same radius at once.
+# Returns the BGR pixels per circle and whether each pixel lies inside the frame.
+def samplePixels(frame, x, y, radius: int):
+  offsetY, offsetX = getDisk(radius)
+  pixelsY = y[:, None] + offsetY[None, :]
+  pixelsX = x[:, None] + offsetX[None, :]
+  valid = (pixelsY >= 0) & (pixelsY < frame.shape[0]) & (pixelsX >= 0) & (pixelsX < frame.shape[1])
+  pixelsY = np.clip(pixelsY, 0, frame.shape[0] - 1)
+  pixelsX = np.clip(pixelsX, 0, frame.shape[1] - 1)
+  return frame[pixelsY, pixelsX], valid, (pixelsY, pixelsX)
+
+# Get the mean color of the pixels with a weight of 1, or black when there are none like cv.mean.
+def getMeans(pixels, weights):
+  counts = weights.sum(1)
+  sums = (weights[:, None, :].astype(np.float64) @ pixels)[:, 0]
+  return np.where(counts[:, None] > 0, np.rint(sums / np.maximum(counts, 1)[:, None]), 0).astype(int)
+
+# Get the mean BGR color of every circle, given as rows of x, y and radius.
+# Without a mask this returns a color per circle.
+# With a mask it returns 2 colors per circle, the mean of the pixels inside the mask and the mean of the pixels outside it,
+# which is the same as taking the mean with the mask and with the inverted mask.
+# Only every nth pixel is used when subsampling.
+def getCircleColors(frame, circles, mask=None, subsample: int = 1):
+  circles = np.asarray(circles, int).reshape(-1, 3)
+  colors = np.zeros((len(circles), 3) if mask is None else (len(circles), 2, 3), int)
+
+  for radius in np.unique(circles[:, 2]):
+    index = np.flatnonzero(circles[:, 2] == radius)
+    pixels, valid, positions = samplePixels(frame, circles[index, 0], circles[index, 1], int(radius))
+    if subsample > 1:
+      pixels, valid, positions = pixels[:, ::subsample], valid[:, ::subsample], (positions[0][:, ::subsample], positions[1][:, ::subsample])
+
+    if mask is None:
+      colors[index] = getMeans(pixels, valid)
+    else:
+      inMask = mask[positions] > 0
+      colors[index, 0] = getMeans(pixels, valid & inMask)
+      colors[index, 1] = getMeans(pixels, valid & ~inMask)
+
+  return colors
+
+# Get the pixels of every circle, padded to the same number of pixels so they can be processed in one batch.
+# Only every nth pixel is used when subsampling. Black pixels are skipped like when using a full-frame mask.
+# Returns the BGR pixels per circle and which of them should be used.
+def sampleCircles(frame, circles, subsample: int = 1):
+  groups = []
+
+  for radius in np.unique(circles[:, 2]):
+    index = np.flatnonzero(circles[:, 2] == radius)
+    pixels, valid, positions = samplePixels(frame, circles[index, 0], circles[index, 1], int(radius))
+    groups.append((index, pixels[:, ::subsample], valid[:, ::subsample]))
+
+  size = max((len(valid[0]) for index, pixels, valid in groups), default=0)
+  pixels = np.zeros((len(circles), size, 3), np.uint8)
+  weights = np.zeros((len(circles), size), bool)
+
+  for index, groupPixels, valid in groups:
+    pixels[index, :groupPixels.shape[1]] = groupPixels
+    weights[index, :valid.shape[1]] = valid
+
+  weights &= pixels.any(2)
+  return pixels, weights
+
+
+## DOMINANT COLORS
+# Engines that find the 2 dominant BGR colors of every circle, given as rows of x, y and radius.
+
+# Runs cv.kmeans for every circle, like the original implementation but only on the pixels of the circle.
+class KMeansColors:
+  def __init__(self, subsample: int = 1):
+    self.subsample = subsample
+
+  # With subsample only every nth of the pixels the engine uses is used.
+  def getColors(self, frame, circles, subsample: int = 1):
+    circles = np.asarray(circles, int).reshape(-1, 3)
+    pixels, weights = sampleCircles(frame, circles, self.subsample * subsample)
+    colors = np.zeros((len(circles), 2, 3), int)
+    # Define the criteria for the kmeans.
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 1, 1.0)
+
+    for i in range(len(circles)):
+      data = np.float32(pixels[i][weights[i]])
+      if len(data) < 2: continue
+      ret, label, center = cv.kmeans(data, 2, None, criteria, 1, cv.KMEANS_PP_CENTERS)
+      colors[i] = np.rint(center)
+
+    return colors
+
+  def reset(self):
+    pass
+
+# Runs a few k-means iterations for all circles at once in NumPy.
+# A circle close to a circle of the previous frame starts from the colors found for that circle,
+# other circles start from the mean of their dark and their bright pixels.
+class BatchedColors:
+  def __init__(self, subsample: int = 1, iterations: int = 2):
+    self.subsample = subsample
+    self.iterations = iterations
+    self.reset()
+
+  # With subsample only every nth of the pixels the engine uses is used.
+  def getColors(self, frame, circles, subsample: int = 1):
+    circles = np.asarray(circles, int).reshape(-1, 3)
+    pixels, weights = sampleCircles(frame, circles, self.subsample * subsample)
+    pixels = np.float32(pixels)
+    centers = self.getInitialCenters(circles, pixels, weights)
+
+    for i in range(self.iterations):
+      # Assign every pixel to the closest center, a pixel is closer to the second center
+      # when its projection on the line between the centers lies past the middle.
+      direction = centers[:, 1] - centers[:, 0]
+      middle = ((centers[:, 1] ** 2).sum(1) - (centers[:, 0] ** 2).sum(1)) / 2
+      second = (pixels @ direction[:, :, None])[:, :, 0] > middle[:, None]
+
+      # Move the centers to the mean of their pixels, a center without pixels stays where it is.
+      for label, members in enumerate((weights & ~second, weights & second)):
+        members = np.float32(members)
+        counts = members.sum(1)
+        sums = (members[:, None, :] @ pixels)[:, 0]
+        centers[:, label] = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers[:, label])
+
+    self.previousCircles = circles
+    self.previousCenters = centers
+    return np.rint(centers).astype(int)
+
+  def getInitialCenters(self, circles, pixels, weights):
+    centers = np.zeros((len(circles), 2, 3), np.float32)
+    if pixels.shape[1] == 0: return centers
+    # Split the pixels on their brightness and start from the mean of the dark and the bright pixels.
+    brightness = pixels.sum(2)
+    counts = np.maximum(weights.sum(1), 1)
+    bright = brightness > ((brightness * weights).sum(1) / counts)[:, None]
+
+    for label, members in enumerate((weights & ~bright, weights & bright)):
+      members = np.float32(members)
+      centers[:, label] = (members[:, None, :] @ pixels)[:, 0] / np.maximum(members.sum(1), 1)[:, None]
+
+    # Start from the colors of the previous frame when the circle barely moved.
+    if len(self.previousCircles) > 0:
+      distances = np.hypot(circles[:, None, 0] - self.previousCircles[None, :, 0], circles[:, None, 1] - self.previousCircles[None, :, 1])
+      nearest = distances.argmin(1)
+      warm = distances[np.arange(len(circles)), nearest] <= circles[:, 2]
+      centers[warm] = self.previousCenters[nearest[warm]]
+
+    return centers
+
+  def reset(self):
+    self.previousCircles = np.empty((0, 3), int)
+    self.previousCenters = np.empty((0, 2, 3), np.float32)
@@ -0,0 +1,152 @@
+import os
+import numpy as np
+import cv2 as cv
+import capture
+import roi
+import util
+
+# The Haar cascade for frontal faces that ships with the repo, also used by the JavaScript demo.
+CASCADE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "classifiers", "haarcascade_frontalface_default.xml")
+# Halve the frame this many times before detecting, the cascade finds faces of 24 pixels and up.
+LEVELS = 2
+# Scan the whole frame every this many frames to find new faces, in between only the area around the faces is scanned.
+FULL_SCAN_EVERY = 10
+# The part of the size of a face that is scanned around it, faces move less than this between frames.
+MARGIN = 0.5
+# A face in a region scan can be this many times smaller or larger than in the previous frame.
+SIZE_CHANGE = 1.5
+
+# The cascade, loaded once by main since loading it takes longer than detecting the faces in a frame.
+classifier = None
+# The faces of the previous frame on the downscaled frame as rows of x, y, width and height.
+faces = np.empty((0, 4), np.int32)
+# The number of frames since the last full scan, and whether a face was lost since.
+frames = 0
+lost = False
+
+def main():
+  global classifier
+
+  # OpenCV 5 moved the Haar cascades out of the main module.
+  if not hasattr(cv, "CascadeClassifier"):
+    util.errorAndExit(f"OpenCV {cv.__version__} has no CascadeClassifier, install OpenCV 4 with: pip3 install \"opencv-python<5\"")
+
+  classifier = cv.CascadeClassifier(CASCADE)
+  if classifier.empty():
+    util.errorAndExit(f"Cannot load the cascade {CASCADE}")
+
+  util.setWindowName("Face detection | OpenCV Demo")
+
+  # The point of this demo is comparing the latency with the circle detectors, so always time the stages.
+  if util.PROFILE is None:
+    util.enableProfiling()
+
+  process()
+
+def process():
+  # Get a video stream from the webcam.
+  # Play around with this for the correct number,
+  # if you only have one webcam, it will be 0.
+  input = capture.openInput(0)
+
+  # Loop for processing the frames.
+  while True:
+    begin = util.millis()
+    with util.stage("capture"):
+      grabbed, frame = input.read()
+
+    # Check if we have a valid frame.
+    if not grabbed:
+      print("Can't receive frame, exiting..")
+      break
+
+    # Detect the faces.
+    found = detect(frame)
+
+    # Draw the faces.
+    with util.stage("draw"):
+      drawFaces(frame, found)
+
+    # Draw the FPS and the stage timings, a full scan and a region scan are timed as separate stages.
+    util.drawFPS(frame, max(util.millis() - begin, 1))
+    util.drawProfile(frame)
+
+    # Show the frame.
+    with util.stage("display"):
+      if not util.show(frame):
+        break
+
+  # Cleanup.
+  input.release()
+  util.closeWindows()
+
+# Detect the faces in a frame without drawing anything, returns them as rows of x, y, width and height.
+# Only the area around the faces of the previous frame is scanned, except every FULL_SCAN_EVERY frames
+# and right after a face was lost.
+def detect(frame):
+  global faces, frames, lost
+
+  # Prepare the frame.
+  with util.stage("convert"):
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    for level in range(LEVELS):
+      gray = cv.pyrDown(gray)
+
+  if frames % FULL_SCAN_EVERY == 0 or lost or len(faces) == 0:
+    with util.stage("full scan"):
+      found = scan(gray)
+    frames = 0
+  else:
+    with util.stage("region scan"):
+      found = scanRegions(gray)
+
+  # A face that wasn't found again may have moved further than the margin, so scan everything next frame.
+  lost = len(found) < len(faces)
+  faces = found
+  frames += 1
+  return found * (1 << LEVELS)
+
+# Scan an image for faces, returns them as rows of x, y, width and height.
+def scan(gray, maxSize=(0, 0)):
+  found = classifier.detectMultiScale(gray, maxSize=maxSize)
+  return np.array(found, np.int32).reshape(-1, 4)
+
+# Only scan the regions around the faces of the previous frame, for faces of about the same size.
+# Most of the time of a scan goes to the smallest faces, so a region is shrunk until the smallest face
+# it can contain has the size of the cascade window.
+def scanRegions(gray):
+  window = classifier.getOriginalWindowSize()[0]
+  found = []
+
+  for left, top, width, height in getRegions(gray.shape):
+    sizes = faces[roi.contains((left, top, width, height), faces[:, 0], faces[:, 1]), 2]
+    scale = min(window / (sizes.min() / SIZE_CHANGE), 1)
+    region = cv.resize(gray[top:top + height, left:left + width], None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+    maxSize = int(sizes.max() * SIZE_CHANGE * scale) + 1
+    inRegion = scan(region, (maxSize, maxSize))
+    found.append(np.round(inRegion / scale).astype(np.int32) + (left, top, 0, 0))
+
+  return np.concatenate(found) if len(found) > 0 else np.empty((0, 4), np.int32)
+
+# The regions around the faces, grown by MARGIN of the size of the face.
+# Overlapping regions are merged, so a face in both is only scanned, and found, once.
+def getRegions(shape):
+  return roi.merge(roi.grow(face, int(face[2] * MARGIN), shape) for face in faces)
+
+# Forget the faces, the next frame is scanned completely.
+def reset():
+  global faces, frames, lost
+  faces = np.empty((0, 4), np.int32)
+  frames = 0
+  lost = False
+
+
+## DRAWING
+def drawFaces(frame, found):
+  for x, y, width, height in found:
+    cv.rectangle(frame, (int(x), int(y)), (int(x + width), int(y + height)), (0, 0, 255), 2)
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,113 @@
+import argparse
+import numpy as np
+import cv2 as cv
+
+# Synthetic pool table frames with known balls, so the detectors can be tested and benchmarked without a camera.
+# The same arguments always give the same frames.
+
+# The felt is within the default HSV slider values of pool-ball-detection.py.
+FELT = (60, 55, 45)
+# BGR colors of the balls, the white and black ball are added separately.
+BALL_COLORS = [(0, 215, 255), (220, 110, 40), (50, 50, 230), (160, 70, 140), (20, 140, 255), (60, 170, 40), (50, 60, 170)]
+
+def main():
+  parser = argparse.ArgumentParser(description="Write a synthetic pool table video.")
+  parser.add_argument("output", help="The video file to write, for example table.avi.")
+  parser.add_argument("--balls", type=int, default=16, help="The number of balls on the table.")
+  parser.add_argument("--frames", type=int, default=300, help="The number of frames.")
+  parser.add_argument("--resolution", default="1280x720", help="The resolution as widthxheight.")
+  parser.add_argument("--noise", type=float, default=4, help="The standard deviation of the camera noise.")
+  parser.add_argument("--seed", type=int, default=0, help="The seed for the positions, colors and noise.")
+  args = parser.parse_args()
+
+  writeVideo(args.output, Table(args.balls, parseResolution(args.resolution), args.noise, args.seed), args.frames)
+
+def parseResolution(resolution: str):
+  width, height = resolution.lower().split("x")
+  return int(width), int(height)
+
+# A table with balls, a few of them roll around and bounce off the sides.
+class Table:
+  def __init__(self, balls: int = 16, resolution=(1280, 720), noise: float = 4, seed: int = 0, radius: int = 14, moving: int = 3):
+    self.resolution = resolution
+    self.noise = noise
+    self.seed = seed
+    self.radius = radius
+    rng = np.random.default_rng(seed)
+    width, height = resolution
+
+    # Put every ball in its own cell of a grid so they don't overlap.
+    spacing = radius * 3
+    cols, rows = (width - spacing * 2) // spacing, (height - spacing * 2) // spacing
+    if balls > cols * rows:
+      raise ValueError(f"{balls} balls don't fit on a {width}x{height} table")
+    cells = rng.choice(cols * rows, balls, replace=False)
+    self.positions = np.float64(np.stack((spacing * 1.5 + cells % cols * spacing, spacing * 1.5 + cells // cols * spacing), 1))
+    self.velocities = np.zeros((balls, 2))
+    self.velocities[:moving] = rng.uniform(-4, 4, (min(moving, balls), 2))
+
+    # The first ball is white, the second black, the rest alternates between solid and striped.
+    self.colors = [(240, 240, 240), (20, 20, 20)] + [BALL_COLORS[i % len(BALL_COLORS)] for i in range(max(balls - 2, 0))]
+    self.striped = [False, False] + [i % 2 == 1 for i in range(max(balls - 2, 0))]
+    self.colors, self.striped = self.colors[:balls], self.striped[:balls]
+
+  # Get a frame, returns the BGR frame and the balls as rows of x, y and radius.
+  def getFrame(self, index: int):
+    width, height = self.resolution
+    positions = self.getPositions(index)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = FELT
+
+    for (x, y), color, striped in zip(positions.tolist(), self.colors, self.striped):
+      drawBall(frame, int(round(x)), int(round(y)), self.radius, color, striped)
+
+    if self.noise > 0:
+      rng = np.random.default_rng((self.seed, index))
+      frame = np.clip(frame + rng.normal(0, self.noise, frame.shape), 0, 255).astype(np.uint8)
+
+    circles = np.hstack((np.round(positions), np.full((len(positions), 1), self.radius)))
+    return frame, circles.astype(int)
+
+  # The position of the balls in a frame, the moving balls bounce off the sides.
+  def getPositions(self, index: int):
+    width, height = self.resolution
+    low = np.array([self.radius, self.radius])
+    size = np.array([width, height]) - self.radius * 2
+    # Fold the straight path back into the table, like a reflection against the sides.
+    travelled = np.mod(self.positions - low + self.velocities * index, size * 2)
+    return low + np.where(travelled > size, size * 2 - travelled, travelled)
+
+  def getFrames(self, count: int):
+    return [self.getFrame(index) for index in range(count)]
+
+# Draw a solid ball, or a white ball with a colored stripe.
+def drawBall(frame, x: int, y: int, radius: int, color, striped: bool):
+  if not striped:
+    cv.circle(frame, (x, y), radius, color, -1)
+    return
+
+  cv.circle(frame, (x, y), radius, (240, 240, 240), -1)
+  stripe = np.zeros((radius * 2 + 1, radius * 2 + 1), np.uint8)
+  cv.circle(stripe, (radius, radius), radius, 255, -1)
+  stripe[:radius // 3 + 1] = 0
+  stripe[-(radius // 3 + 1):] = 0
+
+  # Only the part of the stripe inside the frame.
+  top, left = y - radius, x - radius
+  frameTop, frameLeft = max(top, 0), max(left, 0)
+  frameBottom, frameRight = min(top + stripe.shape[0], frame.shape[0]), min(left + stripe.shape[1], frame.shape[1])
+  part = stripe[frameTop - top:frameBottom - top, frameLeft - left:frameRight - left] > 0
+  frame[frameTop:frameBottom, frameLeft:frameRight][part] = color
+
+def writeVideo(path: str, table: Table, frames: int, fps: int = 30):
+  writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"MJPG"), fps, table.resolution)
+
+  for index in range(frames):
+    writer.write(table.getFrame(index)[0])
+
+  writer.release()
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
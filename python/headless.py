@@ -0,0 +1,127 @@
+import argparse
+import csv
+import importlib
+import json
+import sys
+import capture
+import parallel
+import tracker
+import util
+
+# The detectors that can run headless, mapped to the script that implements them.
+DETECTORS = {
+  "circle": "circle-detection",
+  "color": "circle-detection-with-color",
+  "2-colors-mask": "circle-detection-with-2-colors-mask",
+  "2-colors-kmeans": "circle-detection-with-2-colors-kmeans",
+  "pool-ball": "pool-ball-detection"
+}
+
+def main():
+  parser = argparse.ArgumentParser(description="Run a circle detector without a window and write the detections to a file.")
+  parser.add_argument("detector", choices=DETECTORS.keys(), help="The detector to run.")
+  parser.add_argument("input", help="A video file, image directory or camera number.")
+  parser.add_argument("-o", "--output", default="-", help="The file to write the detections to, - for stdout.")
+  parser.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl", help="The output format.")
+  parser.add_argument("-w", "--workers", type=int, default=1, help="The number of processes, more than 1 splits a file into chunks.")
+  parser.add_argument("--chunk-size", type=int, default=200, help="The number of frames per chunk when using multiple processes.")
+  parser.add_argument("--track", action="store_true", help="Follow the circles over the frames and only search around them, not for pool-ball.")
+  parser.add_argument("--profile", action="store_true", help="Print the time spent per stage when done.")
+  parser.add_argument("--shared-memory", action="store_true", help="Hand out single frames to the processes through shared memory instead of chunks.")
+  args = parser.parse_args()
+
+  if args.profile:
+    util.enableProfiling()
+  if args.track and args.detector == "pool-ball":
+    parser.error("--track is not supported by pool-ball, it already combines the circles of multiple frames")
+  if args.track and args.workers > 1:
+    parser.error("--track is not supported with multiple workers, the tracker follows the circles from frame to frame")
+
+  output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+  writer = JsonLinesWriter(output) if args.format == "jsonl" else CsvWriter(output)
+
+  if args.workers > 1 and args.shared_memory:
+    results = parallel.runShared(DETECTORS[args.detector], args.input, args.workers)
+  elif args.workers > 1:
+    results = parallel.run(DETECTORS[args.detector], args.input, args.workers, args.chunk_size)
+  else:
+    results = detect(loadDetector(args.detector), int(args.input) if args.input.isdigit() else args.input, args.track)
+
+  begin = util.millis()
+  frames = 0
+
+  for index, circles in results:
+    writer.write(index, circles)
+    frames += 1
+
+  # Cleanup.
+  if output is not sys.stdout:
+    output.close()
+
+  duration = max(util.millis() - begin, 1)
+  print(f"Processed {frames} frames in {duration} ms ({round(frames * 1000 / duration)} fps).", file=sys.stderr)
+
+# Run a detector over every frame of the input, yields the frame index and detected circles.
+def detect(detector, source, track: bool = False):
+  input = capture.openInput(source)
+  circleTracker = tracker.CircleTracker() if track else None
+  index = 0
+
+  # Loop for processing the frames.
+  while True:
+    with util.stage("capture"):
+      grabbed, frame = input.read()
+
+    if not grabbed:
+      break
+
+    yield index, detector.detect(frame) if circleTracker is None else detector.detect(frame, circleTracker)
+    index += 1
+
+  # Cleanup.
+  input.release()
+
+# Import the script of a detector, the script names contain dashes so they can't be imported directly.
+def loadDetector(name: str):
+  return importlib.import_module(DETECTORS[name])
+
+# Convert a circle to plain Python types so it can be serialized.
+def formatCircle(index: int, circle):
+  return {
+    "frame": index,
+    "x": int(circle["x"]),
+    "y": int(circle["y"]),
+    "radius": int(circle["radius"]),
+    "colors": circle["colors"][:circle["colorCount"]].tolist()
+  }
+
+
+## WRITERS
+# Writes a JSON object per detection on a separate line.
+class JsonLinesWriter:
+  def __init__(self, file):
+    self.file = file
+
+  def write(self, index: int, circles):
+    for circle in circles:
+      self.file.write(json.dumps(formatCircle(index, circle)) + "\n")
+
+# Writes a CSV row per detection, the BGR values of up to 2 colors get their own columns.
+class CsvWriter:
+  COLUMNS = ["frame", "x", "y", "radius", "color1_b", "color1_g", "color1_r", "color2_b", "color2_g", "color2_r"]
+
+  def __init__(self, file):
+    self.writer = csv.writer(file)
+    self.writer.writerow(self.COLUMNS)
+
+  def write(self, index: int, circles):
+    for circle in circles:
+      circle = formatCircle(index, circle)
+      colors = [channel for color in circle["colors"] for channel in color]
+      colors += [""] * (6 - len(colors))
+      self.writer.writerow([circle["frame"], circle["x"], circle["y"], circle["radius"]] + colors)
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
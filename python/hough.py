@@ -0,0 +1,134 @@
+import concurrent.futures
+import os
+import numpy as np
+import cv2 as cv
+
+# The HoughCircles parameters used by the circle detection scripts.
+# dp: Inverse ratio of the accumulator resolution to the image resolution, 1 = same as input, 2 = half the input.
+# minDist: Minimum distance between the centers of the circles.
+# param1: High threshold for the Canny edge detector (low is half).
+# param2: Accumulator threshold for the circle centers, smaller means more false circle may be detected.
+# minRadius: Minimum circle radius.
+# maxRadius: Maximum cirlce radius.
+DEFAULT = {
+  "dp": 1,
+  "minDist": 35,
+  "param1": 150,
+  "param2": 25,
+  "minRadius": 5,
+  "maxRadius": 45
+}
+
+# The threads that search the tiles of findCirclesTiled, started with the first tiled search.
+POOL = None
+
+# Detect circles using HoughCircles, returns the circles as rows of x, y and radius.
+# With levels the circles are found coarse to fine, see findCirclesCoarseToFine.
+# Otherwise with tiles the image is split into tiles by tiles that are searched on multiple threads, see findCirclesTiled.
+def findCircles(gray, params=DEFAULT, levels: int = 0, tiles: int = 0):
+  if levels > 0: return findCirclesCoarseToFine(gray, params, levels)
+  if tiles > 1: return findCirclesTiled(gray, params, tiles)
+
+  circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, params["dp"], params["minDist"], param1=params["param1"], param2=params["param2"], minRadius=params["minRadius"], maxRadius=params["maxRadius"])
+  if circles is None: return np.empty((0, 3), np.float32)
+  return circles[0]
+
+# Detect circles in a part of the image, returns the circles in the coordinates of the whole image.
+def findCirclesInWindow(gray, x: int, y: int, width: int, height: int, params=DEFAULT):
+  left, top = max(int(x), 0), max(int(y), 0)
+  right, bottom = min(int(x + width), gray.shape[1]), min(int(y + height), gray.shape[0])
+  if right - left < 3 or bottom - top < 3: return np.empty((0, 3), np.float32)
+
+  circles = findCircles(gray[top:bottom, left:right], params)
+  return circles + np.float32([left, top, 0])
+
+# Find candidates on the image halved levels times, then search a small window around every candidate
+# in the full image for a circle about the size of the candidate.
+# The small image and the small windows are much cheaper than searching the whole image for every radius.
+def findCirclesCoarseToFine(gray, params=DEFAULT, levels: int = 2):
+  scale = 2 ** levels
+  coarse = gray
+  for level in range(levels):
+    coarse = cv.pyrDown(coarse)
+
+  # The circles in the small image are smaller and have fewer edge pixels voting for them.
+  # The votes drop less than the size because the downscaling also removes the noise, and a
+  # lower threshold gives more false candidates to search around.
+  coarseParams = dict(params,
+    minDist=params["minDist"] / scale,
+    param2=max(params["param2"] / scale, 1),
+    minRadius=max(params["minRadius"] // scale, 1),
+    maxRadius=-(-params["maxRadius"] // scale) + 1
+  )
+  circles = []
+
+  # The strongest candidates first, so they win when 2 candidates turn out to be the same circle.
+  for x, y, radius in (findCircles(coarse, coarseParams) * scale).tolist():
+    if isNear(circles, x, y, params["minDist"]): continue
+
+    # A pixel in the small image is scale pixels in the full image, so the candidate can be off by that much.
+    minRadius = max(int(radius) - scale, params["minRadius"])
+    maxRadius = min(int(radius) + scale, params["maxRadius"])
+    if minRadius > maxRadius: continue
+
+    size = (maxRadius + scale * 2) * 2
+    found = findCirclesInWindow(gray, x - size / 2, y - size / 2, size, size, dict(params, minRadius=minRadius, maxRadius=maxRadius))
+    if len(found) == 0: continue
+
+    closest = found[np.argmin(np.hypot(found[:, 0] - x, found[:, 1] - y))]
+    if not isNear(circles, closest[0], closest[1], params["minDist"]):
+      circles.append(closest)
+
+  return np.float32(circles).reshape(-1, 3)
+
+# Split the image into tiles by tiles and search them on a pool of threads, for large images where a single
+# HoughCircles call barely uses more than one core. Every tile is grown by more than maxRadius on each side,
+# so a circle with its center in a tile lies completely within the grown tile. Only the circles with their center
+# in the tile itself are kept, and of the circles closer than minDist across the border of 2 tiles only the first is kept,
+# like HoughCircles does within an image. Returns the circles like findCircles.
+def findCirclesTiled(gray, params=DEFAULT, tiles: int = 2):
+  height, width = gray.shape[:2]
+  overlap = params["maxRadius"] + 2
+
+  # Without a maximum radius a circle can be as large as the image, and small images aren't worth splitting.
+  tiles = min(tiles, width // (overlap * 2), height // (overlap * 2))
+  if params["maxRadius"] <= 0 or tiles <= 1: return findCircles(gray, params)
+
+  columns = np.linspace(0, width, tiles + 1).astype(int).tolist()
+  rows = np.linspace(0, height, tiles + 1).astype(int).tolist()
+  parts = [(left, top, right, bottom) for top, bottom in zip(rows, rows[1:]) for left, right in zip(columns, columns[1:])]
+  found = getPool().map(lambda part: findCirclesInTile(gray, part, overlap, params), parts)
+
+  # The circles of a tile are ordered from the most votes to the least, and the votes of different tiles can't be compared.
+  # Taking the circles of all tiles by their place in their tile keeps the strongest circles first.
+  found = list(found)
+  ranks = np.concatenate([np.arange(len(circles)) for circles in found])
+  circles = []
+
+  for x, y, radius in np.concatenate(found)[np.argsort(ranks, kind="stable")].tolist():
+    if not isNear(circles, x, y, params["minDist"]):
+      circles.append((x, y, radius))
+
+  return np.float32(circles).reshape(-1, 3)
+
+# Search a tile given as left, top, right and bottom grown by overlap, returns the circles with their center in the tile.
+def findCirclesInTile(gray, part, overlap: int, params=DEFAULT):
+  left, top, right, bottom = part
+  circles = findCirclesInWindow(gray, left - overlap, top - overlap, right - left + overlap * 2, bottom - top + overlap * 2, params)
+  inside = (circles[:, 0] >= left) & (circles[:, 0] < right) & (circles[:, 1] >= top) & (circles[:, 1] < bottom)
+  return circles[inside]
+
+def getPool():
+  global POOL
+  if POOL is None:
+    POOL = concurrent.futures.ThreadPoolExecutor(os.cpu_count())
+  return POOL
+
+# Whether a position is closer than distance to the center of one of the circles.
+def isNear(circles, x: float, y: float, distance: float):
+  return any(np.hypot(x - circle[0], y - circle[1]) < distance for circle in circles)
+
+# Format circles as rows of x, y and radius like HoughCircles does, None when there are no circles.
+def toHoughCircles(circles):
+  if len(circles) == 0: return None
+  return np.float32(circles).reshape(1, -1, 3)
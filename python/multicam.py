@@ -0,0 +1,162 @@
+import argparse
+import concurrent.futures
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import capture
+import headless
+import preview
+import util
+
+# Runs a circle detector on multiple cameras and videos at once in one process, for example one camera per table.
+# Every source is captured on its own thread and the detection of all sources runs on a shared pool of threads,
+# OpenCV and NumPy release the GIL while they work so the sources are processed on all cores.
+# A source has at most one frame in detection at a time, so the detectors that keep state between frames see
+# the frames in order. Every source has its own copy of the detector, with its own state and buffers.
+# Cameras always get their newest frame, the frames in between are dropped when the detection can't keep up.
+
+def main():
+  parser = argparse.ArgumentParser(description="Run a circle detector on multiple cameras and videos at once.")
+  parser.add_argument("detector", choices=headless.DETECTORS.keys(), help="The detector to run.")
+  parser.add_argument("sources", nargs="+", help="The video files, image directories or camera numbers.")
+  parser.add_argument("-w", "--workers", type=int, help="The number of detection threads, defaults to the number of cores.")
+  parser.add_argument("-o", "--output", help="The file to write the detections to as JSON Lines, - for stdout.")
+  parser.add_argument("--show", action="store_true", help="Show the sources with their circles in one window.")
+  parser.add_argument("--interval", type=float, default=5, help="The seconds between the frame rates printed per source.")
+  args = parser.parse_args()
+
+  sources = [int(source) if source.isdigit() else source for source in args.sources]
+  output = None if args.output is None else sys.stdout if args.output == "-" else open(args.output, "w")
+  runner = MultiSourceRunner(args.detector, sources, args.workers)
+
+  if args.show:
+    util.setWindowName("Multi camera | OpenCV Demo")
+    grid = preview.Preview([str(source) for source in sources], 1, round(100 / max(len(sources) ** 0.5, 1)))
+    latest = [None] * len(sources)
+
+  lastReport = time.perf_counter()
+
+  for source, index, frame, circles in runner.run():
+    if output is not None:
+      for circle in circles:
+        output.write(json.dumps({ "source": str(source.source), **headless.formatCircle(index, circle) }) + "\n")
+
+    # Stop showing when the window was closed, the frames that are still in detection are only written.
+    if args.show and not runner.stopped.is_set():
+      source.detector.drawCircles(frame, circles)
+      util.drawFPS(frame, 1000 / max(source.getFPS(), 1e-3))
+      latest[source.index] = frame
+
+      # Show the grid when every source has a frame, the other sources keep their last frame.
+      if all(image is not None for image in latest) and not grid.show(latest[0], latest[1:]):
+        runner.stop()
+
+    if time.perf_counter() - lastReport >= args.interval:
+      lastReport = time.perf_counter()
+      printFPS(runner.sources)
+
+  # Cleanup.
+  printFPS(runner.sources)
+  if output is not None and output is not sys.stdout:
+    output.close()
+  if args.show:
+    util.closeWindows()
+
+# Print the frame rate and the number of processed frames of every source.
+def printFPS(sources):
+  print(", ".join(f"{source.source}: {source.getFPS():.1f} fps ({source.frames} frames)" for source in sources), file=sys.stderr)
+
+# A camera or video with its own copy of the detector.
+class Source:
+  def __init__(self, index: int, source, detector):
+    self.index = index
+    self.source = source
+    self.detector = detector
+    self.input = capture.openInput(source)
+    self.frames = 0
+    self.begin = None
+    self.end = None
+
+  # The average frame rate since the first frame.
+  def getFPS(self) -> float:
+    if self.begin is None or self.frames == 0: return 0.0
+    return self.frames / max((self.end or time.perf_counter()) - self.begin, 1e-6)
+
+# Captures every source on its own thread and detects the circles of all sources on a shared pool of threads.
+class MultiSourceRunner:
+  def __init__(self, detector: str, sources, workers: int = None):
+    self.sources = [Source(index, source, loadDetector(detector, index)) for index, source in enumerate(sources)]
+    self.pool = concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count())
+    self.results = queue.Queue(maxsize=len(self.sources) * 2)
+    self.stopped = threading.Event()
+
+  # Process the sources until all of them ended or stop is called,
+  # yields the source, frame index, frame and circles of every processed frame.
+  def run(self):
+    threads = [threading.Thread(target=self.capture, args=(source,), daemon=True) for source in self.sources]
+    for thread in threads:
+      thread.start()
+
+    running = len(threads)
+    while running > 0:
+      result = self.results.get()
+
+      # A source that ended puts None in the results.
+      if result is None:
+        running -= 1
+      else:
+        yield result
+
+    # Cleanup.
+    for thread in threads:
+      thread.join()
+    self.pool.shutdown()
+
+  # Read the frames of a source and hand them to the pool one at a time.
+  def capture(self, source: Source):
+    index = 0
+
+    try:
+      while not self.stopped.is_set():
+        grabbed, frame = source.input.read()
+        if not grabbed: break
+
+        if source.begin is None:
+          source.begin = time.perf_counter()
+
+        circles = self.pool.submit(source.detector.detect, frame).result()
+        source.frames += 1
+        self.put((source, index, frame, circles))
+        index += 1
+    finally:
+      source.end = time.perf_counter()
+      source.input.release()
+      self.put(None)
+
+  # Put a result in the queue, gives up when stopped so a full queue can't block a source forever.
+  def put(self, result):
+    while True:
+      try:
+        return self.results.put(result, timeout=0.1)
+      except queue.Full:
+        if self.stopped.is_set() and result is not None: return
+
+  def stop(self):
+    self.stopped.set()
+
+# Load a separate copy of the script of a detector for every source, so every source has its own state.
+def loadDetector(name: str, index: int):
+  module = headless.DETECTORS[name]
+  spec = importlib.util.spec_from_file_location(f"{module}-{index}", os.path.join(os.path.dirname(os.path.abspath(__file__)), module + ".py"))
+  detector = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(detector)
+  return detector
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
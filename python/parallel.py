@@ -0,0 +1,121 @@
+import collections
+import importlib
+import multiprocessing
+import os
+import cv2 as cv
+import sharedframes
+import util
+
+# The detector and shared frame ring of a worker process when processing frames from shared memory.
+detector = None
+ring = None
+
+# Process a video on multiple cores by splitting it into chunks of frames.
+# Each worker seeks to the start of its chunk and the results are returned in frame order.
+# Detectors that keep state between frames define WARMUP, the number of frames before a chunk
+# that are processed (and thrown away) to fill their buffers, and reset() to clear them.
+def run(module: str, path: str, workers: int = None, chunkSize: int = 200):
+  input = util.openInput(path)
+  frameCount = int(input.get(cv.CAP_PROP_FRAME_COUNT))
+  input.release()
+
+  if frameCount <= 0:
+    util.errorAndExit("Cannot process a stream in parallel, the number of frames is unknown")
+
+  chunks = [(module, path, start, min(start + chunkSize, frameCount)) for start in range(0, frameCount, chunkSize)]
+
+  with multiprocessing.Pool(workers, initializer=initWorker) as pool:
+    # imap keeps the order of the chunks while they are processed in parallel.
+    for results in pool.imap(processChunk, chunks):
+      yield from results
+
+# Process a video on multiple cores by handing out single frames to the workers.
+# The frames are decoded once, straight into shared memory, and the workers only receive the slot index.
+# This only works for detectors that don't keep state between frames.
+def runShared(module: str, source, workers: int = None, slots: int = None):
+  if getattr(importlib.import_module(module), "WARMUP", 0) > 0:
+    util.errorAndExit("Cannot process single frames in parallel, the detector keeps state between frames")
+
+  input = util.openInput(source)
+  grabbed, frame = input.read()
+
+  if not grabbed:
+    input.release()
+    return
+
+  # Size the ring on the first frame, with enough slots to keep every worker busy.
+  workers = workers or os.cpu_count()
+  frames = sharedframes.SharedFrameRing(frame.shape, slots or workers * 2)
+  slot = frames.acquire()
+  frames.frame(slot)[...] = frame
+  pending = collections.deque()
+  index = 0
+
+  # Always free the shared memory, also when a worker or the caller raised or stopped early.
+  try:
+    with multiprocessing.Pool(workers, initializer=initWorker, initargs=(module, frames)) as pool:
+      while slot is not None:
+        frames.publish(slot)
+        pending.append((index, pool.apply_async(processSlot, (slot,))))
+        index += 1
+
+        # Return the results that are done, in frame order.
+        while len(pending) > 0 and pending[0][1].ready():
+          done, result = pending.popleft()
+          yield done, result.get()
+
+        # Blocks until a worker released a slot.
+        slot = frames.readInto(input)
+
+      while len(pending) > 0:
+        done, result = pending.popleft()
+        yield done, result.get()
+  finally:
+    # Cleanup.
+    input.release()
+    frames.close()
+
+# The processes already use all cores, so stop OpenCV from starting threads on top of that.
+def initWorker(module: str = None, frames: sharedframes.SharedFrameRing = None):
+  global detector, ring
+  cv.setNumThreads(1)
+
+  if module is not None:
+    detector = importlib.import_module(module)
+  ring = frames
+
+def processSlot(slot: int):
+  try:
+    return detector.detect(ring.frame(slot))
+  finally:
+    ring.release(slot)
+
+def processChunk(chunk):
+  module, path, start, end = chunk
+  detector = importlib.import_module(module)
+  warmup = min(start, getattr(detector, "WARMUP", 0))
+
+  # Clear the state left behind by the previous chunk of this worker.
+  if hasattr(detector, "reset"):
+    detector.reset()
+
+  input = util.openInput(path)
+  # Seeking is frame accurate for image directories and most video files,
+  # some codecs can only seek to the nearest key frame.
+  input.set(cv.CAP_PROP_POS_FRAMES, start - warmup)
+  results = []
+
+  for index in range(start - warmup, end):
+    grabbed, frame = input.read()
+
+    if not grabbed:
+      break
+
+    circles = detector.detect(frame)
+
+    # Only keep the results of the chunk itself, not of the warm-up.
+    if index >= start:
+      results.append((index, circles))
+
+  input.release()
+  return results
@@ -1,6 +1,12 @@
 import numpy as np
 import cv2 as cv
 import collections
+import capture
+import colors
+import hough
+import preprocess
+import preview
+import roi
 import util
 
 # Dictionary for the HSV mask sliders.
@@ -20,15 +26,64 @@ CIRCLE = {
   "highThresh": 140,
   "accThresh": 14,
   "minRadius": 12,
-  "maxRadius": 16
+  "maxRadius": 16,
+  # Find the circles on the image halved this many times first and then only search around them, 0 searches the whole image.
+  "levels": 0
 }
 
+# Number of pixels cut off each side of the frame.
+CROP = 70
+# Find the table in the frame with the HSV mask instead of cutting off a fixed number of pixels.
+AUTO_TABLE = False
+# Only redetect the circles in the parts of the frame that changed since their circles were last detected.
+# Only used by the live loop of this script, detect() processes the whole frame so its circles don't depend
+# on which frames it saw before, like when headless.py splits a video into chunks.
+MOTION_GATING = True
+# Split the frame into this many tiles by this many tiles that are searched for circles on multiple threads,
+# for large frames like 4K where a single HoughCircles call barely uses more than one core. 0 searches it in one go.
+# Only used without levels, run benchmark-hough.py to see whether it's faster on your machine.
+HOUGH_TILES = 0
+# Mask out the felt with a lookup table of every color instead of converting every frame to HSV.
+# Gives the same circles, run benchmark-masking.py to see which is faster on your machine.
+HSV_LOOKUP = False
+# Update the masks shown next to the output every this many frames, 0 only shows the output.
+PREVIEW_EVERY = 5
+# Play a video file over and over to tune the sliders. The results of every step are kept per frame,
+# so only the steps after a moved slider run again. Replaces MOTION_GATING while replaying.
+REPLAY = False
+# The memory the kept results of REPLAY may use, in MiB.
+REPLAY_CACHE_SIZE = 1024
+
+# The table as x, y, width and height, kept until the camera moves.
+table = None
+# Finds the parts of the frame that changed.
+motionGate = roi.MotionGate()
+# The results of the previous frame, reused for the parts of the frame that didn't change.
+previous = None
+# Keeps the buffers of the preprocessing between frames.
+preprocessor = preprocess.Preprocessor()
+# The lookup table for the felt, rebuilt when the HSV sliders change.
+feltLookup = preprocess.RangeLookup()
+# The results of every step per frame when replaying.
+frameCache = util.Cache(REPLAY_CACHE_SIZE * 1024 * 1024)
+# Set when a slider moved, so the whole frame is processed again with the new values.
+slidersMoved = False
+
 # Size limited collection for the circle buffer.
 detectedCircles = collections.deque(maxlen=15)
 
+# Number of frames needed to fill the circle buffer when starting halfway a video.
+WARMUP = detectedCircles.maxlen - 1
+
 def main():
   util.setWindowName("Pool ball detection | OpenCV Demo")
+  # The sliders belong to the window, so they are created on the thread that shows it.
+  util.runOnOutput(createTrackbars)
+
+  # Start processing.
+  process()
 
+def createTrackbars():
   # Create sliders for the HSV values.
   cv.createTrackbar("lowH", util.WINDOW_NAME, HSV["lowH"], 180, lambda val: onHSVTrackbar("lowH", val))
   cv.createTrackbar("highH", util.WINDOW_NAME, HSV["highH"], 180, lambda val: onHSVTrackbar("highH", val))
@@ -43,29 +98,48 @@ def main():
   cv.createTrackbar("accThresh", util.WINDOW_NAME, CIRCLE["accThresh"], 255, lambda val: onCircleTrackbar("accThresh", val))
   cv.createTrackbar("minRadius", util.WINDOW_NAME, CIRCLE["minRadius"], 100, lambda val: onCircleTrackbar("minRadius", val))
   cv.createTrackbar("maxRadius", util.WINDOW_NAME, CIRCLE["maxRadius"], 100, lambda val: onCircleTrackbar("maxRadius", val))
-
-  # Start processing.
-  process()
+  cv.createTrackbar("levels", util.WINDOW_NAME, CIRCLE["levels"], 4, lambda val: onCircleTrackbar("levels", val))
 
 # Update a HSV value when a slider is moved.
 def onHSVTrackbar(name, value):
+  global slidersMoved
   HSV[name] = value
+  slidersMoved = True
+
+  if HSV_LOOKUP:
+    feltLookup.build(*getFeltRange())
 
 # Update a circle detection value when a slider is moved.
 def onCircleTrackbar(name, value):
+  global slidersMoved
   CIRCLE[name] = value
+  slidersMoved = True
 
 def process():
   # Get a video stream from the webcam.
   # Play around with this for the correct number,
   # if you only have one webcam, it will be 0.
-  input = util.openInput(0)
-  # input = util.openInput("../potje-pool.mp4")
+  source = 0
+  # source = "../potje-pool.mp4"
+  input = capture.openInput(source)
+  # The index of the frame in the video, the key of the kept results when replaying.
+  index = 0
+  # Shows the masks next to the output.
+  debugPreview = preview.Preview(["Output", "Masked frame", "Frame mask", "Color mask"], PREVIEW_EVERY)
 
   # Loop for processing the frames.
   while True:
     begin = util.millis()
-    grabbed, frame = input.read()
+    with util.stage("capture"):
+      grabbed, frame = input.read()
+
+    # Start the video over when replaying, the results of the frames are kept.
+    if not grabbed and REPLAY and index > 0:
+      input.release()
+      input = capture.openInput(source)
+      reset()
+      index = 0
+      continue
 
     # Check if we have a valid frame.
     if not grabbed:
@@ -73,152 +147,256 @@ def process():
       break
     
     # Prepare the frame.
-    frame = frame[70:frame.shape[0] - 70, 70:frame.shape[1] - 70]
-    # gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-    # gray = cv.pyrDown(gray)
-    # gray = cv.medianBlur(gray, 5)
-    # thresh, gray = cv.threshold(gray, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
-    # gray = cv.adaptiveThreshold(gray, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_MASK, 11, 5)
-
-    hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
-    hsvMask = cv.inRange(hsv, (HSV["lowH"], HSV["lowS"], HSV["lowV"]), (HSV["highH"], HSV["highS"], HSV["highV"]))
-
-    hsvMask = cv.bitwise_not(hsvMask)
-    maskedFrame = cv.bitwise_and(frame, frame, mask = hsvMask)
-    gray = cv.cvtColor(maskedFrame, cv.COLOR_BGR2GRAY)
-    gray = cv.medianBlur(gray, 5)
-
-    # Detect circles using HoughCircles.
-    # Params:
-    # 1: The input image.
-    # 2: The type of detection, only HOUGH_GRADIENT is supported.
-    # 3: dp - Inverse ratio of the accumulator resolution to the image resolution, 1 = same as input, 2 = half the input.
-    # 4: minDist - Minimum distance between the centers of the circles.
-    # 5 (param1): highThreshold - High threshold for the Canny edge detector (low is half).
-    # 6 (param2): accumulatorThreshold - Accumulator threshold for the circle centers, smaller means more false circle may be detected.
-    #             Circles with the largest accumulator will be returned first.
-    # 7 (minRadius): Minimum circle radius.
-    # 8 (maxRadius): Maximum cirlce radius.
-    # circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, 1, 20, param1=100, param2=14, minRadius=14, maxRadius=14)
-    # circles = cv.HoughCircles(hsvMask, cv.HOUGH_GRADIENT, 1, 25, param1=50, param2=14, minRadius=14, maxRadius=16)
-    circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, CIRCLE["dp"] / 10, CIRCLE["minDist"], param1=CIRCLE["highThresh"], param2=CIRCLE["accThresh"], minRadius=CIRCLE["minRadius"], maxRadius=CIRCLE["maxRadius"])
-    detectedCircles.append(getDetectedCircles(circles, util.getRatio(frame, gray)))
-
-    # Form a 2 color mask.
-    thresh, mask = cv.threshold(frame, 160, 255, cv.THRESH_BINARY)
-    mask = cv.cvtColor(mask, cv.COLOR_BGR2GRAY)
-    thresh, mask = cv.threshold(mask, 230, 255, cv.THRESH_BINARY)
+    frame = crop(frame)
 
-    circles = getCircles()
+    # Detect the circles.
+    circles, maskedFrame, hsvMask, mask = analyze(frame, index if REPLAY else None, MOTION_GATING)
+    index += 1
 
     # Draw the circles.
-    if len(circles) > 0:
-      # Get the first color.
-      for circle in circles:
-        circle["colors"].append(getCircleColor(frame, mask, circle))
-      # Invert the mask.
-      mask = cv.bitwise_not(mask)
-      # Get the second color.
-      for circle in circles:
-        circle["colors"].append(getCircleColor(frame, mask, circle))
-      # Draw the circles.
+    with util.stage("draw"):
       drawCircles(frame, circles)
     
-    # Draw the FPS.
-    util.drawFPS(frame, util.millis() - begin)
-
-    # Convert the grayscale images to color
-    hsvMask = cv.cvtColor(hsvMask, cv.COLOR_GRAY2BGR)
-    mask = cv.cvtColor(mask, cv.COLOR_GRAY2BGR)
-
-    # Show the frame.
-    util.drawTitle(frame, "Output")
-    util.drawTitle(maskedFrame, "Masked frame")
-    util.drawTitle(hsvMask, "Frame mask")
-    util.drawTitle(mask, "Color mask")
-    image = createImage(frame, maskedFrame, hsvMask, mask)
-    if not util.show(image):
-      break
+    # Draw the FPS and the stage timings when profiling, the quality scheduler adapts to the same time.
+    duration = util.millis() - begin
+    util.drawFPS(frame, duration)
+    util.updateQuality(duration)
+    util.drawProfile(frame)
+
+    # Record the frame and the circles when recording.
+    with util.stage("record"):
+      util.record(frame, circles)
+
+    # Show the frame, the quality scheduler can update the masks less often or stop showing them.
+    with util.stage("display"):
+      debugPreview.every = PREVIEW_EVERY * util.getQuality()["preview"]
+      if not debugPreview.show(frame, (maskedFrame, hsvMask, mask)):
+        break
 
   # Cleanup.
   input.release()
-  cv.destroyAllWindows()
-
-# Transform the detected circles using HoughCircles into an array of x, y and radius tuples.
-def getDetectedCircles(circles, ratio):
-  if circles is None: return []
-  # Format and round the detected circles so we can loop.
-  circles = np.uint16(np.around(circles))
-  detectedCircles = []
+  util.closeWindows()
+
+# Get the part of the frame with the table as x, y, width and height.
+def getTable(frame):
+  global table
+
+  if table is None:
+    found = roi.findTable(getFeltMask(frame)) if AUTO_TABLE else None
+    table = found if found is not None else (CROP, CROP, frame.shape[1] - CROP * 2, frame.shape[0] - CROP * 2)
+
+  return table
+
+# Cut off the edges of the frame that are not part of the table.
+def crop(frame):
+  x, y, width, height = getTable(frame)
+  return frame[y:y + height, x:x + width]
+
+# Get the felt of the table, the pixels within the HSV slider values.
+def getFeltMask(frame):
+  return preprocessor.getRangeMask(frame, *getFeltRange())
+
+# The HSV slider values as the lowest and highest color of the felt.
+def getFeltRange():
+  return (HSV["lowH"], HSV["lowS"], HSV["lowV"]), (HSV["highH"], HSV["highS"], HSV["highV"])
+
+# Detect the circles in a cropped frame, also returns the intermediate masks for showing.
+# When gated only the regions around the parts that changed since the previous frame are processed again.
+# With the index of the frame in a video the whole frame is processed, reusing the kept results of the steps.
+def analyze(frame, index=None, gated: bool = False):
+  global previous, table, slidersMoved
+  regions = [(0, 0, frame.shape[1], frame.shape[0])]
+
+  if slidersMoved:
+    slidersMoved = False
+    previous = None
+
+  if gated and index is None:
+    with util.stage("motion"):
+      motionGate.update(frame)
+
+    if motionGate.cameraMoved:
+      # Find the table again in the next frame and start over.
+      table = None
+      previous = None
+      detectedCircles.clear()
+    elif previous is not None and previous["hsvMask"].shape == frame.shape[:2]:
+      # The circles with their center close to a change may have moved.
+      regions = motionGate.getChangedRegions(frame.shape, CIRCLE["maxRadius"])
+
+  if previous is None or previous["hsvMask"].shape != frame.shape[:2]:
+    previous = {
+      "detections": np.empty((0, 3), np.int32),
+      "colors": {},
+      "hsvMask": np.zeros(frame.shape[:2], np.uint8),
+      "maskedFrame": np.zeros(frame.shape, np.uint8),
+      "mask": np.zeros(frame.shape[:2], np.uint8)
+    }
+
+  hsvMask, maskedFrame, mask = previous["hsvMask"], previous["maskedFrame"], previous["mask"]
+  detections = previous["detections"]
+
+  for region in regions:
+    # Search a bit further so the circles in the region are completely visible.
+    x, y, width, height = roi.grow(region, CIRCLE["maxRadius"] + 2, frame.shape)
+    part = frame[y:y + height, x:x + width]
+    # The region is relative to the table, which AUTO_TABLE can find at another place in the same frame.
+    key = None if index is None else (index, table, x, y, width, height)
+    # The masks are written straight into the results of the previous frame.
+    gray = maskFrame(part, hsvMask[y:y + height, x:x + width], maskedFrame[y:y + height, x:x + width], key)
+
+    with util.stage("hough"):
+      found = getDetectedCircles(findCircles(gray, key), util.getRatio(part, gray)) + np.int32([x, y, 0])
+
+    with util.stage("colors"):
+      getColorMask(part, mask[y:y + height, x:x + width], key)
+
+    # Replace the circles with their center in the region, the regions don't overlap.
+    keep = ~roi.contains(region, detections[:, 0], detections[:, 1])
+    add = roi.contains(region, found[:, 0], found[:, 1])
+    detections = np.vstack((detections[keep], found[add]))
+
+  with util.stage("grouping"):
+    detectedCircles.append(detections)
+    circles = getCircles()
 
-  for circle in circles[0, :]:
-    # Get the postion and dimension.
-    x = circle[0] * ratio
-    y = circle[1] * ratio
-    radius = circle[2] * ratio
+  # Only get the colors of new circles and circles in the regions, the others didn't change.
+  # The colors are kept by the position and size of the circle.
+  keys = list(map(tuple, util.getRows(circles).tolist()))
+  circleColors = {}
+  for key in keys:
+    if key in previous["colors"] and not any(roi.contains(region, key[0], key[1]) for region in regions):
+      circleColors[key] = previous["colors"][key]
+
+  missing = [key for key in keys if key not in circleColors]
+  with util.stage("colors"):
+    # Get the colors inside and outside the mask.
+    for key, circleColor in zip(missing, colors.getCircleColors(frame, missing, mask, util.getQuality()["subsample"])):
+      circleColors[key] = circleColor
+
+  util.setColors(circles, [circleColors[key] for key in keys])
+
+  previous["detections"] = detections
+  previous["colors"] = circleColors
+  return circles, maskedFrame, hsvMask, mask
+
+# Mask out the felt of the table into hsvMask and maskedFrame, returns the blurred grayscale masked frame.
+# With a key the results are kept, the frame is only converted to HSV once and only masked again when the HSV sliders moved.
+def maskFrame(frame, hsvMask, maskedFrame, key=None):
+  # gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+  # gray = cv.pyrDown(gray)
+  # gray = cv.medianBlur(gray, 5)
+  # thresh, gray = cv.threshold(gray, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
+  # gray = cv.adaptiveThreshold(gray, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_MASK, 11, 5)
+
+  if key is None:
+    return preprocessor.maskRange(frame, *getFeltRange(), hsvMask, maskedFrame, lookup=feltLookup if HSV_LOOKUP else None)[2]
+
+  masked = frameCache.get((key, "masked", getFeltRange()), lambda: preprocessor.maskRange(frame, *getFeltRange(), hsv=getHSV(frame, key)))
+  np.copyto(hsvMask, masked[0])
+  np.copyto(maskedFrame, masked[1])
+  return masked[2]
+
+# The HSV frame, kept because it doesn't depend on the sliders.
+def getHSV(frame, key):
+  return frameCache.get((key, "hsv"), lambda: preprocessor.toHSV(frame))
+
+# With a key the circles are kept, they are only detected again when a slider or the quality changed.
+# The quality scheduler can search coarser than the sliders to keep up with the target frame rate.
+def findCircles(gray, key=None):
+  quality = util.getQuality()
+
+  if key is not None:
+    return frameCache.get((key, "circles", getFeltRange(), tuple(CIRCLE.items()), quality["levels"]), lambda: findCircles(gray))
+
+  levels = max(CIRCLE["levels"], quality["levels"])
+
+  # Detect circles using HoughCircles with the slider values, see hough.DEFAULT for what the parameters do.
+  # circles = cv.HoughCircles(gray, cv.HOUGH_GRADIENT, 1, 20, param1=100, param2=14, minRadius=14, maxRadius=14)
+  # circles = cv.HoughCircles(hsvMask, cv.HOUGH_GRADIENT, 1, 25, param1=50, param2=14, minRadius=14, maxRadius=16)
+  if levels > 0 or HOUGH_TILES > 1:
+    params = { "dp": CIRCLE["dp"] / 10, "minDist": CIRCLE["minDist"], "param1": CIRCLE["highThresh"], "param2": CIRCLE["accThresh"], "minRadius": CIRCLE["minRadius"], "maxRadius": CIRCLE["maxRadius"] }
+    return hough.toHoughCircles(hough.findCircles(gray, params, levels, HOUGH_TILES))
+
+  return cv.HoughCircles(gray, cv.HOUGH_GRADIENT, CIRCLE["dp"] / 10, CIRCLE["minDist"], param1=CIRCLE["highThresh"], param2=CIRCLE["accThresh"], minRadius=CIRCLE["minRadius"], maxRadius=CIRCLE["maxRadius"])
+
+# Form a 2 color mask, into dst when given. With a key the mask is kept.
+def getColorMask(frame, dst=None, key=None):
+  if key is not None:
+    np.copyto(dst, frameCache.get((key, "colorMask"), lambda: preprocessor.getColorMask(frame, 160)))
+    return dst
+
+  return preprocessor.getColorMask(frame, 160, dst)
+
+# Detect the circles in a frame without drawing anything.
+# The circles are translated back to the coordinates of the uncropped frame.
+def detect(frame):
+  x, y, width, height = getTable(frame)
+  circles = analyze(crop(frame))[0]
+  circles["x"] += x
+  circles["y"] += y
+  return circles
 
-    detectedCircles.append((x, y, radius))
+# Clear the circle buffer and the results of the previous frame, for example before processing another part of a video.
+def reset():
+  global table, previous
+  detectedCircles.clear()
+  motionGate.reset()
+  table = None
+  previous = None
 
-  return detectedCircles
+# Transform the detected circles using HoughCircles into an array with a row of x, y and radius per circle.
+def getDetectedCircles(circles, ratio):
+  if circles is None: return np.empty((0, 3), np.int32)
+  # Format and round the detected circles.
+  return np.int32(np.uint16(np.around(circles[0]))) * ratio
 
 # Get the detected circles based on the values in the circle buffer.
 def getCircles():
-  if len(detectedCircles) != detectedCircles.maxlen: return []
-  groupedCircles = []
-  circles = []
+  if len(detectedCircles) != detectedCircles.maxlen: return util.toCircles(None)
+  circles = np.concatenate(detectedCircles)
+  if len(circles) == 0: return util.toCircles(None)
+  groups = groupCircles(circles)
 
-  # Group circles that are within a few pixels of each other.
-  for circle in detectedCircles:
-    for c in circle:
-      existingCircle = next((x for x in groupedCircles if util.inRange(x[0][0], c[0], 10) & util.inRange(x[0][1], c[1], 6)), None)
+  # Get the average of the groups that have a circle in every frame and build the circles for drawing.
+  counts = np.bincount(groups)
+  sums = np.zeros((len(counts), 3), np.int64)
+  np.add.at(sums, groups, circles)
+  means = sums[counts == detectedCircles.maxlen] // detectedCircles.maxlen
 
-      if existingCircle is None:
-        groupedCircles.append([c])
-      else:
-        existingCircle.append(c)
+  return util.toCircles(means)
 
-  # Get the average of the group and build the circle for drawing.
-  for group in groupedCircles:
-    if len(group) != detectedCircles.maxlen: continue
-    mean = np.mean(group, 0, np.integer)
+# Group circles that are within a few pixels of each other, returns the group index of every circle.
+# A circle joins the first group whose first circle is in range, otherwise it starts a new group.
+# Every circle before the first circle without a group already has one, so that circle starts the
+# next group and all circles in its range that don't have a group yet join it.
+def groupCircles(circles, rangeX: int = 10, rangeY: int = 6):
+  groups = np.full(len(circles), -1)
+  x, y = circles[:, 0], circles[:, 1]
+  group = 0
+  first = 0
 
-    circles.append({ "x": mean[0], "y": mean[1], "radius": mean[2], "colors": [] })
+  while first < len(circles):
+    inRange = (groups < 0) & (np.abs(x - x[first]) <= rangeX) & (np.abs(y - y[first]) <= rangeY)
+    groups[inRange] = group
+    group += 1
 
-  return circles
+    # Find the next circle without a group.
+    remaining = np.flatnonzero(groups[first:] < 0)
+    first = first + remaining[0] if len(remaining) > 0 else len(circles)
 
-def getCircleColor(frame, frameMask, circle):
-  # Create a mask the same size as our frame and fill it with zeros (black).
-  mask = np.zeros(frame.shape[:2], np.uint8)
-  # Draw our circle in white on the mask.
-  cv.circle(mask, (circle["x"], circle["y"]), circle["radius"], (255, 255, 255, 255), -1)
-  # Merge the masks.
-  mask = cv.bitwise_and(frameMask, mask)
-  # Get the mean color of the masked circle
-  mean = cv.mean(frame, mask)
-  
-  # Return the BGR values as integer.
-  return (round(mean[0]), round(mean[1]), round(mean[2]))
+  return groups
 
 
 ## DRAWING
 def drawCircles(frame, circles):
-  for circle in circles:
+  for x, y, radius, circleColors in util.toTuples(circles):
     # Draw white circle.
-    # cv.circle(frame, (circle["x"], circle["y"]), circle["radius"], (255, 255, 255), 2)
+    # cv.circle(frame, (x, y), radius, (255, 255, 255), 2)
     # Draw the first color on the frame.
-    cv.ellipse(frame, (circle["x"], circle["y"]), (circle["radius"] + 8, circle["radius"] + 8), 0, 90, 270, circle["colors"][0], 4)
+    cv.ellipse(frame, (x, y), (radius + 8, radius + 8), 0, 90, 270, circleColors[0], 4)
     # Draw the second color on the frame.
-    cv.ellipse(frame, (circle["x"], circle["y"]), (circle["radius"] + 8, circle["radius"] + 8), 0, 270, 450, circle["colors"][1], 4)
-
-
-## UTIL
-def createImage(src1, src2, src3, src4):
-  # Resize all sources to 60% of their original size.
-  size = 60
-  # Create the rows.
-  row1 = np.hstack((util.resize(src1, size), util.resize(src2, size)))
-  row2 = np.hstack((util.resize(src3, size), util.resize(src4, size)))
-  return np.vstack((row1, row2))
+    cv.ellipse(frame, (x, y), (radius + 8, radius + 8), 0, 270, 450, circleColors[1], 4)
 
 
 # Run the main function if the file is run as a script.
@@ -0,0 +1,115 @@
+import numpy as np
+import cv2 as cv
+import util
+
+# The preprocessing of the detectors, writing every step into buffers that are kept between frames
+# so a frame doesn't allocate new images. The results are views into the buffers and are overwritten
+# by the next frame, copy them to keep them longer.
+class Preprocessor:
+  def __init__(self):
+    self.buffers = {}
+
+  # Get a buffer with at least the given shape, returns a view of the top left part with exactly that shape.
+  # A buffer only grows, so the changing regions of pool-ball-detection.py reuse the buffer of the largest one.
+  def getBuffer(self, name: str, shape, dtype=np.uint8):
+    buffer = self.buffers.get(name)
+
+    if buffer is None or buffer.dtype != dtype or buffer.ndim != len(shape):
+      buffer = self.buffers[name] = np.empty(shape, dtype)
+    elif any(size < needed for size, needed in zip(buffer.shape, shape)):
+      buffer = self.buffers[name] = np.empty(np.maximum(buffer.shape, shape), dtype)
+
+    return buffer[tuple(slice(0, size) for size in shape)]
+
+  # Convert a frame to grayscale, halve the size and blur it, for the circle detection scripts.
+  def toGray(self, frame, blur: int = 5):
+    height, width = frame.shape[:2]
+
+    with util.stage("convert"):
+      gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=self.getBuffer("gray", (height, width)))
+      small = cv.pyrDown(gray, dst=self.getBuffer("small", ((height + 1) // 2, (width + 1) // 2)))
+    with util.stage("blur"):
+      return cv.medianBlur(small, blur, dst=self.getBuffer("blurred", small.shape))
+
+  # Form a 2 color mask, the pixels that are bright in every channel.
+  def getColorMask(self, frame, threshold: int, dst=None):
+    if dst is None:
+      dst = self.getBuffer("colorMask", frame.shape[:2])
+
+    thresh, bright = cv.threshold(frame, threshold, 255, cv.THRESH_BINARY, dst=self.getBuffer("bright", frame.shape))
+    cv.cvtColor(bright, cv.COLOR_BGR2GRAY, dst=dst)
+    thresh, mask = cv.threshold(dst, 230, 255, cv.THRESH_BINARY, dst=dst)
+    return mask
+
+  def toHSV(self, frame):
+    return cv.cvtColor(frame, cv.COLOR_BGR2HSV, dst=self.getBuffer("hsv", frame.shape))
+
+  # Get the pixels of a frame within a HSV range, uses hsv as the HSV frame when given.
+  def getRangeMask(self, frame, low, high, dst=None, hsv=None):
+    if dst is None:
+      dst = self.getBuffer("rangeMask", frame.shape[:2])
+    if hsv is None:
+      hsv = self.toHSV(frame)
+
+    return cv.inRange(hsv, low, high, dst=dst)
+
+  # Mask out the pixels within a HSV range, returns the mask, the masked frame and the blurred grayscale masked frame.
+  # The mask and masked frame are written into hsvMask and maskedFrame when given.
+  # With a RangeLookup the grayscale masked frame is looked up and the mask is the pixels that aren't 0 in it,
+  # which only differs for the black pixels outside the range that are 0 in the grayscale masked frame either way.
+  # Without a RangeLookup hsv is used as the HSV frame when given.
+  def maskRange(self, frame, low, high, hsvMask=None, maskedFrame=None, blur: int = 5, lookup=None, hsv=None):
+    if hsvMask is None:
+      hsvMask = self.getBuffer("hsvMask", frame.shape[:2])
+    if maskedFrame is None:
+      maskedFrame = self.getBuffer("maskedFrame", frame.shape)
+
+    with util.stage("convert"):
+      gray = self.getBuffer("gray", frame.shape[:2])
+
+      if lookup is None:
+        cv.bitwise_not(self.getRangeMask(frame, low, high, hsvMask, hsv), dst=hsvMask)
+      else:
+        lookup.build(low, high)
+        cv.compare(lookup.lookup(frame, self, gray), 0, cv.CMP_NE, dst=hsvMask)
+
+      # The masked out pixels are left as they are, so clear them first.
+      maskedFrame[:] = 0
+      cv.bitwise_and(frame, frame, dst=maskedFrame, mask=hsvMask)
+
+      if lookup is None:
+        cv.cvtColor(maskedFrame, cv.COLOR_BGR2GRAY, dst=gray)
+    with util.stage("blur"):
+      return hsvMask, maskedFrame, cv.medianBlur(gray, blur, dst=self.getBuffer("blurred", gray.shape))
+
+# A lookup table from every BGR color to its grayscale value, or 0 when the color is within a HSV range.
+# Masking a frame then takes a single lookup per pixel instead of a HSV conversion, a range check,
+# a bitwise not and a grayscale conversion. The HSV and grayscale value of every color is kept,
+# so a new range only takes a range check over them.
+class RangeLookup:
+  def __init__(self):
+    self.range = None
+    self.table = None
+    self.hsv = None
+    self.gray = None
+
+  # Build the table for a HSV range, does nothing when the range didn't change.
+  def build(self, low, high):
+    if self.range == (tuple(low), tuple(high)): return
+
+    if self.hsv is None:
+      # Every color as an image, the color with index b + g * 256 + r * 65536 is pixel b + g * 256 + r * 65536.
+      colors = cv.cvtColor(np.arange(1 << 24, dtype=np.uint32).view(np.uint8).reshape(4096, 4096, 4), cv.COLOR_BGRA2BGR)
+      self.hsv = cv.cvtColor(colors, cv.COLOR_BGR2HSV)
+      self.gray = cv.cvtColor(colors, cv.COLOR_BGR2GRAY)
+
+    inside = cv.inRange(self.hsv, low, high)
+    self.table = cv.bitwise_and(self.gray, cv.bitwise_not(inside)).reshape(-1)
+    self.range = (tuple(low), tuple(high))
+
+  # Look up the grayscale frame with the colors within the range set to 0.
+  def lookup(self, frame, buffers: Preprocessor, dst):
+    # With a 4th channel every pixel is a 32 bit number, the first 3 bytes are the index in the table.
+    bgra = cv.cvtColor(frame, cv.COLOR_BGR2BGRA, dst=buffers.getBuffer("bgra", frame.shape[:2] + (4,)))
+    index = np.bitwise_and(bgra.view(np.uint32)[..., 0], 0xFFFFFF, out=buffers.getBuffer("index", frame.shape[:2], np.intp))
+    return np.take(self.table, index, out=dst, mode="clip")
@@ -0,0 +1,49 @@
+import numpy as np
+import cv2 as cv
+import util
+
+# Shows the output frame next to the intermediate images of a detector, in one image that is kept between frames.
+# The output is drawn every frame, the intermediate images only every few frames because they are only there to look at.
+# With every set to 0 only the output frame is shown and the intermediate images are never touched.
+class Preview:
+  def __init__(self, titles, every: int = 5, scale: int = 60, columns: int = 2):
+    self.titles = titles
+    self.every = every
+    self.scale = scale
+    self.columns = columns
+    self.canvas = None
+    self.gray = None
+    self.frames = 0
+
+  # Draw the frame and the views into the preview image, returns the image.
+  # The views are the intermediate images in the order of the titles after the first one, color or grayscale.
+  def render(self, frame, views):
+    if self.every <= 0: return frame
+
+    height, width = round(frame.shape[0] * self.scale / 100), round(frame.shape[1] * self.scale / 100)
+    rows = -(-len(self.titles) // self.columns)
+    due = self.frames % self.every == 0
+    self.frames += 1
+
+    if self.canvas is None or self.canvas.shape != (rows * height, self.columns * width, 3):
+      self.canvas = np.zeros((rows * height, self.columns * width, 3), np.uint8)
+      self.gray = np.empty((height, width), np.uint8)
+      due = True
+
+    for i, (title, image) in enumerate(zip(self.titles, [frame] + (list(views) if due else []))):
+      top, left = i // self.columns * height, i % self.columns * width
+      tile = self.canvas[top:top + height, left:left + width]
+
+      # Resize before converting a grayscale image, that converts less pixels.
+      if image.ndim == 2:
+        cv.cvtColor(cv.resize(image, (width, height), dst=self.gray), cv.COLOR_GRAY2BGR, dst=tile)
+      else:
+        cv.resize(image, (width, height), dst=tile)
+
+      util.drawTitle(tile, title, self.scale / 100)
+
+    return self.canvas
+
+  # Show the frame and the views, returns false when the window should close like util.show.
+  def show(self, frame, views):
+    return util.show(self.render(frame, views))
@@ -0,0 +1,108 @@
+import numpy as np
+import cv2 as cv
+
+# Find the table in a mask of the felt, returns the bounding box of the largest felt area as x, y, width and height.
+# Returns None when the felt covers less than the given part of the frame.
+def findTable(feltMask, minArea: float = 0.25):
+  contours, hierarchy = cv.findContours(feltMask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+  if len(contours) == 0: return None
+
+  table = max(contours, key=cv.contourArea)
+  if cv.contourArea(table) < minArea * feltMask.shape[0] * feltMask.shape[1]: return None
+
+  return cv.boundingRect(table)
+
+# Finds the tiles of a frame that changed since they were last detected.
+# The frames are compared at a lower resolution, which is cheap and ignores most of the camera noise.
+class MotionGate:
+  def __init__(self, tileSize: int = 32, threshold: int = 16, scale: int = 4, movedRatio: float = 0.5):
+    self.tileSize = tileSize
+    self.threshold = threshold
+    self.scale = scale
+    self.movedRatio = movedRatio
+    self.reset()
+
+  def reset(self):
+    self.previous = None
+    self.changed = None
+    self.cameraMoved = False
+
+  # Compare a frame with the reference, returns which tiles changed as a grid of booleans.
+  # The reference of a tile is the frame it last changed in, the frame its circles were last detected in,
+  # so a slow drift that stays under the threshold from frame to frame still adds up to a change.
+  def update(self, frame):
+    height, width = frame.shape[:2]
+    small = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    small = cv.resize(small, (max(width // self.scale, 1), max(height // self.scale, 1)), interpolation=cv.INTER_AREA)
+    rows, cols = -(-height // self.tileSize), -(-width // self.tileSize)
+
+    if self.previous is None or self.previous.shape != small.shape:
+      # Everything changed when there is nothing to compare with.
+      self.changed = np.ones((rows, cols), bool)
+      self.cameraMoved = False
+    else:
+      difference = cv.absdiff(small, self.previous)
+      # Pad the difference to whole tiles and take the largest difference per tile.
+      tile = self.tileSize // self.scale
+      padded = np.zeros((rows * tile, cols * tile), np.uint8)
+      padded[:difference.shape[0], :difference.shape[1]] = difference
+      self.changed = padded.reshape(rows, tile, cols, tile).max((1, 3)) > self.threshold
+      # When most of the frame changed, it's more likely the camera moved than that the balls did.
+      self.cameraMoved = self.changed.mean() > self.movedRatio
+
+    if self.previous is None or self.previous.shape != small.shape or self.cameraMoved:
+      self.previous = small
+    else:
+      # Only the changed tiles are detected again, the others keep comparing with their old reference.
+      tile = self.tileSize // self.scale
+      changedPixels = np.repeat(np.repeat(self.changed, tile, 0), tile, 1)[:small.shape[0], :small.shape[1]]
+      np.copyto(self.previous, small, where=changedPixels)
+
+    return self.changed
+
+  # The bounding boxes of the groups of changed tiles that touch as x, y, width and height, grown by a margin on each side.
+  # Boxes that overlap after growing are merged, so every part of the frame is in at most one of them.
+  # Returns an empty list when nothing changed.
+  def getChangedRegions(self, shape, margin: int = 0):
+    count, labels, stats, centroids = cv.connectedComponentsWithStats(np.uint8(self.changed), connectivity=8)
+    # The first component is the background of unchanged tiles.
+    regions = [grow((left * self.tileSize, top * self.tileSize, width * self.tileSize, height * self.tileSize), margin, shape)
+      for left, top, width, height, area in stats[1:].tolist()]
+    return merge(regions)
+
+# Grow a region given as x, y, width and height by a margin on each side, without going outside the frame.
+def grow(region, margin: int, shape):
+  x, y, width, height = region
+  left, top = max(x - margin, 0), max(y - margin, 0)
+  right, bottom = min(x + width + margin, shape[1]), min(y + height + margin, shape[0])
+  return int(left), int(top), int(right - left), int(bottom - top)
+
+# Merge the regions given as x, y, width and height that overlap, until none of them overlap.
+def merge(regions):
+  regions = list(regions)
+  merged = True
+
+  while merged:
+    merged = False
+    for i in range(len(regions)):
+      for j in range(i + 1, len(regions)):
+        if overlaps(regions[i], regions[j]):
+          regions[i] = union(regions[i], regions.pop(j))
+          merged = True
+          break
+      if merged: break
+
+  return regions
+
+def overlaps(a, b):
+  return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+def union(a, b):
+  left, top = min(a[0], b[0]), min(a[1], b[1])
+  right, bottom = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+  return left, top, right - left, bottom - top
+
+# Whether points given as x and y arrays lie inside a region given as x, y, width and height.
+def contains(region, x, y):
+  left, top, width, height = region
+  return (x >= left) & (x < left + width) & (y >= top) & (y < top + height)
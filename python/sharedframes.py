@@ -0,0 +1,78 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# A ring of frame slots in shared memory, so frames can be passed to other processes without copying them.
+# The capture process acquires a free slot, reads a frame into it and publishes it with the number of readers.
+# Every reader releases the slot when done and the last release puts it back in the ring.
+class SharedFrameRing:
+  def __init__(self, shape, slots: int = 8):
+    self.shape = tuple(shape)
+    self.slots = slots
+    self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * slots)
+    self.frames = np.ndarray((slots,) + self.shape, np.uint8, buffer=self.memory.buf)
+    self.references = multiprocessing.Array("i", slots)
+    self.free = multiprocessing.Queue()
+    self.owner = True
+
+    for slot in range(slots):
+      self.free.put(slot)
+
+  # Only the handles are pickled, the other process attaches to the same shared memory.
+  def __getstate__(self):
+    return (self.shape, self.slots, self.memory.name, self.references, self.free)
+
+  def __setstate__(self, state):
+    self.shape, self.slots, name, self.references, self.free = state
+    self.memory = shared_memory.SharedMemory(name=name)
+    self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, buffer=self.memory.buf)
+    self.owner = False
+
+  # Get a free slot to write a frame into, blocks until a reader released one.
+  def acquire(self) -> int:
+    return self.free.get()
+
+  # Read the next frame of an input directly into a free slot.
+  # Returns the slot, or None when there are no more frames.
+  def readInto(self, input):
+    slot = self.acquire()
+    grabbed, frame = input.read(self.frames[slot])
+
+    if not grabbed:
+      self.free.put(slot)
+      return None
+
+    # The input allocated a new frame, for example because it can't read into a given image.
+    if not np.shares_memory(frame, self.frames[slot]):
+      if frame.shape != self.shape:
+        self.free.put(slot)
+        raise ValueError(f"A frame of {frame.shape} doesn't fit the slots of {self.shape}, all frames need the same size")
+      self.frames[slot][...] = frame
+
+    return slot
+
+  # Make a slot available to the given number of readers.
+  def publish(self, slot: int, readers: int = 1):
+    with self.references.get_lock():
+      self.references[slot] = readers
+
+  # The frame in a slot, this is a view on the shared memory and not a copy.
+  def frame(self, slot: int):
+    return self.frames[slot]
+
+  # Called by a reader when it is done with a slot.
+  def release(self, slot: int):
+    with self.references.get_lock():
+      self.references[slot] -= 1
+      recycle = self.references[slot] <= 0
+
+    if recycle:
+      self.free.put(slot)
+
+  def close(self):
+    # Drop the view before closing, the memory can't be closed while it is exported.
+    self.frames = None
+    self.memory.close()
+
+    if self.owner:
+      self.memory.unlink()
@@ -0,0 +1,122 @@
+import itertools
+import numpy as np
+import hough
+
+# A circle that is followed over multiple frames.
+class Track:
+  def __init__(self, id: int, x: float, y: float, radius: float):
+    self.id = id
+    self.x = x
+    self.y = y
+    self.radius = radius
+    self.velocityX = 0.0
+    self.velocityY = 0.0
+    self.missed = 0
+
+  # The position in the next frame when the circle keeps its velocity.
+  def predict(self):
+    return self.x + self.velocityX, self.y + self.velocityY
+
+  def update(self, x: float, y: float, radius: float):
+    # Smooth the velocity so a single bad measurement doesn't throw the prediction off.
+    self.velocityX = (self.velocityX + x - self.x) / 2
+    self.velocityY = (self.velocityY + y - self.y) / 2
+    self.x = x
+    self.y = y
+    self.radius = radius
+    self.missed = 0
+
+# Follows circles over frames with a constant velocity model, so HoughCircles only has to search
+# small windows around the predicted positions instead of the whole image.
+# The whole image is searched every fullEvery frames to find new circles, and in the next frame when a circle is lost.
+# With levels the whole image is searched coarse to fine, see hough.findCirclesCoarseToFine.
+class CircleTracker:
+  def __init__(self, params=hough.DEFAULT, fullEvery: int = 10, margin: int = 10, maxMissed: int = 2, levels: int = 0):
+    self.params = params
+    self.levels = levels
+    self.fullEvery = fullEvery
+    self.margin = margin
+    self.maxMissed = maxMissed
+    self.tracks = []
+    self.ids = []
+    self.nextId = itertools.count()
+    self.frames = 0
+    self.lost = False
+
+  # Find the circles in a grayscale image, returns them in the same format as HoughCircles.
+  # The ids of the returned circles are in self.ids.
+  def update(self, gray):
+    if self.frames % self.fullEvery == 0 or self.lost or len(self.tracks) == 0:
+      found = self.detect(gray)
+    else:
+      found = self.search(gray)
+
+    self.frames += 1
+    # Forget the circles that have not been seen for a while.
+    self.tracks = [track for track in self.tracks if track.missed <= self.maxMissed]
+    self.ids = [track.id for track in found]
+    return hough.toHoughCircles([(track.x, track.y, track.radius) for track in found])
+
+  # Search the whole image and match the circles to the tracks.
+  def detect(self, gray):
+    circles = hough.findCircles(gray, self.params, self.levels)
+    unmatched = list(self.tracks)
+    found = []
+
+    # HoughCircles returns the strongest circles first, so they get the first pick.
+    for x, y, radius in circles.tolist():
+      track = self.getClosest(unmatched, x, y)
+
+      if track is None:
+        track = Track(next(self.nextId), x, y, radius)
+        self.tracks.append(track)
+      else:
+        unmatched.remove(track)
+        track.update(x, y, radius)
+
+      found.append(track)
+
+    for track in unmatched:
+      track.missed += 1
+
+    self.lost = False
+    return found
+
+  # Search a small window around the predicted position of every track.
+  def search(self, gray):
+    found = []
+
+    for track in self.tracks:
+      x, y = track.predict()
+      # Only look for circles about the same size as the tracked circle.
+      radius = int(round(track.radius))
+      params = dict(self.params, minRadius=max(radius - 2, 0), maxRadius=radius + 2)
+      size = (radius + self.margin) * 2
+      circles = hough.findCirclesInWindow(gray, x - size / 2, y - size / 2, size, size, params)
+
+      if len(circles) == 0:
+        track.missed += 1
+        self.lost = True
+        continue
+
+      # Take the circle closest to the prediction.
+      closest = np.argmin(np.hypot(circles[:, 0] - x, circles[:, 1] - y))
+      track.update(*circles[closest].tolist())
+      found.append(track)
+
+    return found
+
+  # The track predicted closest to a position, if it is within its radius.
+  def getClosest(self, tracks, x: float, y: float):
+    closest = None
+    closestDistance = None
+
+    for track in tracks:
+      predictedX, predictedY = track.predict()
+      distance = np.hypot(predictedX - x, predictedY - y)
+
+      if distance <= max(track.radius, self.margin) and (closest is None or distance < closestDistance):
+        closest = track
+        closestDistance = distance
+
+    return closest
@@ -0,0 +1,227 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import time
+import numpy as np
+import cv2 as cv
+import fixtures
+import headless
+import hough
+import util
+
+# Searches the HoughCircles and HSV parameters of a detector for the fastest ones that still find the labeled balls.
+# The labels are the frame, x, y and radius of every ball, in the JSON Lines format of headless.py,
+# so the output of a headless run can be corrected by hand and used as labels.
+# Only the frames with at least one label are used. Without labels synthetic frames from fixtures.py are used.
+
+# The values tried for every parameter, a random sample of the combinations is evaluated.
+# circle: the parameters of hough.DEFAULT, used by the circle detection scripts on the frame at half size.
+# pool-ball: the HSV and CIRCLE slider values of pool-ball-detection.py.
+SPACES = {
+  "circle": {
+    "dp": [1, 1.5, 2],
+    "minDist": [20, 35, 50],
+    "param1": [100, 150, 200],
+    "param2": [15, 20, 25, 30],
+    "minRadius": [3, 5, 8],
+    "maxRadius": [15, 30, 45],
+    "levels": [0, 1, 2]
+  },
+  "pool-ball": {
+    "HSV": {
+      "highS": [50, 70, 90],
+      "lowV": [30, 45, 60],
+      "highV": [140, 160, 200]
+    },
+    "CIRCLE": {
+      "dp": [10, 15, 20],
+      "minDist": [15, 25, 35],
+      "highThresh": [100, 140, 180],
+      "accThresh": [10, 14, 18, 22],
+      "minRadius": [10, 12],
+      "maxRadius": [16, 18],
+      "levels": [0, 2, 3]
+    }
+  }
+}
+
+# The detector, frames and labels of a worker process.
+name = None
+detector = None
+frames = None
+labels = None
+
+def main():
+  parser = argparse.ArgumentParser(description="Search the fastest detector parameters that find the labeled balls.")
+  parser.add_argument("detector", choices=SPACES.keys(), help="The detector to tune.")
+  parser.add_argument("input", nargs="?", help="A video file or image directory with labeled frames.")
+  parser.add_argument("-l", "--labels", help="The labels as JSON Lines with a frame, x, y and radius per ball.")
+  parser.add_argument("--synthetic", type=int, default=20, help="The number of synthetic frames when there is no input.")
+  parser.add_argument("-n", "--samples", type=int, default=200, help="The number of parameter combinations to try.")
+  parser.add_argument("-w", "--workers", type=int, help="The number of processes, defaults to the number of cores.")
+  parser.add_argument("--recall", type=float, default=0.9, help="The part of the labeled balls that has to be found.")
+  parser.add_argument("--precision", type=float, default=0.9, help="The part of the found circles that has to be a labeled ball.")
+  parser.add_argument("--seed", type=int, default=0, help="The seed for sampling the combinations.")
+  args = parser.parse_args()
+
+  if (args.input is None) != (args.labels is None):
+    parser.error("the input and the labels have to be given together")
+  if args.input is None and args.synthetic < 1:
+    parser.error("there have to be synthetic frames to tune on without an input")
+
+  if args.input is None:
+    frames, labels = zip(*fixtures.Table(16).getFrames(args.synthetic))
+  else:
+    frames, labels = loadLabeled(args.input, args.labels)
+
+  # The time and scores are averages over the frames.
+  if len(frames) == 0:
+    util.errorAndExit("There are no frames to tune on, the labels match no frame of the input")
+
+  candidates = getCandidates(SPACES[args.detector], args.samples, args.seed)
+  results = search(args.detector, frames, labels, candidates, args.workers)
+  passed = [result for result in results if result["recall"] >= args.recall and result["precision"] >= args.precision]
+
+  print(f"{len(passed)} of {len(results)} combinations have a recall of {args.recall} and a precision of {args.precision}.")
+  # Without a combination that meets the targets, show the ones that come closest.
+  shown = sorted(passed, key=lambda result: result["time"]) if len(passed) > 0 else sorted(results, key=lambda result: -result["recall"] * result["precision"])
+
+  print("    time  recall  precision  parameters")
+  for result in shown[:10]:
+    print(f"{result['time']:6.2f}ms  {result['recall']:6.2f}  {result['precision']:9.2f}  {json.dumps(result['params'])}")
+
+  if len(passed) > 0:
+    print("Fastest:")
+    print(json.dumps(shown[0]["params"], indent=2))
+
+# Read the labeled frames of a video or image directory, returns the frames and the balls as rows of x, y and radius.
+def loadLabeled(input: str, path: str):
+  balls = {}
+  with open(path) as file:
+    for line in filter(str.strip, file):
+      label = json.loads(line)
+      balls.setdefault(label["frame"], []).append((label["x"], label["y"], label["radius"]))
+
+  source = util.openInput(input)
+  frames, labels = [], []
+  index = 0
+
+  while index <= max(balls.keys(), default=-1):
+    grabbed, frame = source.read()
+    if not grabbed: break
+
+    if index in balls:
+      frames.append(frame)
+      labels.append(np.array(balls[index]))
+    index += 1
+
+  source.release()
+  return frames, labels
+
+# Sample combinations of the values in a space, nested spaces give nested combinations.
+def getCandidates(space, samples: int, seed: int):
+  rng = np.random.default_rng(seed)
+  candidates = []
+  seen = set()
+
+  # Sampling more than the number of combinations would never finish.
+  total = np.prod([len(values) for values in getValues(space)])
+  while len(candidates) < min(samples, total):
+    candidate = sample(space, rng)
+    key = json.dumps(candidate, sort_keys=True)
+
+    if key not in seen:
+      seen.add(key)
+      candidates.append(candidate)
+
+  return candidates
+
+def getValues(space):
+  for values in space.values():
+    yield from getValues(values) if isinstance(values, dict) else [values]
+
+def sample(space, rng):
+  return { key: sample(values, rng) if isinstance(values, dict) else values[rng.integers(len(values))] for key, values in space.items() }
+
+# Evaluate the candidates on multiple processes, returns the time, recall and precision of every candidate.
+def search(detectorName: str, frames, labels, candidates, workers: int = None):
+  # Candidates with the same HSV values share the masked frames, so they go to the same task and the frames
+  # are only masked once per HSV setting. Large groups are split so all workers have something to do.
+  groups = {}
+  for candidate in candidates:
+    groups.setdefault(json.dumps(candidate.get("HSV"), sort_keys=True), []).append(candidate)
+  tasks = [group[start:start + 16] for group in groups.values() for start in range(0, len(group), 16)]
+
+  with multiprocessing.Pool(workers, initializer=initWorker, initargs=(detectorName, frames, labels)) as pool:
+    return [result for results in pool.imap_unordered(evaluate, tasks) for result in results]
+
+def initWorker(detectorName: str, workerFrames, workerLabels):
+  global name, detector, frames, labels
+  # The processes already use all cores, and a single thread gives comparable timings.
+  cv.setNumThreads(1)
+  name = detectorName
+  detector = headless.loadDetector(detectorName)
+  frames = workerFrames
+  labels = workerLabels
+
+def evaluate(candidates):
+  results = []
+
+  for candidate in candidates:
+    images, preprocessTime = preprocess(json.dumps(candidate.get("HSV"), sort_keys=True))
+    found = 0
+    correct = 0
+    detections = 0
+    begin = time.perf_counter()
+
+    for frame, image, balls in zip(frames, images, labels):
+      circles = findCircles(frame, image, candidate)
+      distances = np.hypot(balls[:, None, 0] - circles[None, :, 0], balls[:, None, 1] - circles[None, :, 1])
+      found += (distances.min(1, initial=np.inf) <= balls[:, 2]).sum()
+      correct += (distances.min(0, initial=np.inf) <= balls[:, 2].max()).sum()
+      detections += len(circles)
+
+    duration = (time.perf_counter() - begin) / len(frames) + preprocessTime
+    results.append({
+      "params": candidate,
+      "time": duration * 1000,
+      "recall": found / max(sum(map(len, labels)), 1),
+      "precision": correct / detections if detections > 0 else 0.0
+    })
+
+  return results
+
+# The preprocessed frames for a HSV setting, kept for the next tasks with the same setting.
+# Returns the images and the preprocessing time per frame in seconds.
+@functools.lru_cache(maxsize=4)
+def preprocess(hsv: str):
+  images = []
+  begin = time.perf_counter()
+
+  for frame in frames:
+    if name == "pool-ball":
+      detector.HSV.update(json.loads(hsv))
+      gray = detector.maskFrame(frame, np.empty(frame.shape[:2], np.uint8), np.empty(frame.shape, np.uint8))
+    else:
+      gray = detector.preprocessor.toGray(frame)
+
+    # The preprocessor reuses its buffers for the next frame.
+    images.append(gray.copy())
+
+  return images, (time.perf_counter() - begin) / len(frames)
+
+# Find the circles in a preprocessed frame, returns them as rows of x, y and radius in the coordinates of the frame.
+def findCircles(frame, image, candidate):
+  if name == "pool-ball":
+    detector.CIRCLE.update(candidate["CIRCLE"])
+    return detector.getDetectedCircles(detector.findCircles(image), 1)
+
+  params = dict(candidate)
+  levels = params.pop("levels")
+  return hough.findCircles(image, params, levels) * util.getRatio(frame, image)
+
+
+# Run the main function if the file is run as a script.
+if __name__ == "__main__":
+  main()
@@ -1,7 +1,16 @@
+import atexit
+import collections
+import contextlib
+import functools
+import os
+import sys
+import threading
 import time
+import numpy as np
 import cv2 as cv
 
 WINDOW_NAME = "OpenCV Demo"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
 
 
 ## GENERAL
@@ -22,8 +31,20 @@ def inRange(val1: int, val2: int, range: int) -> bool:
   return val1 + range >= val2 and val1 - range <= val2
 
 # INPUT
-def openInput(input, props=[]):
-  input = cv.VideoCapture(input)
+# The directory to keep the decoded frames of video files in, set the FRAME_CACHE environment variable to enable it.
+FRAME_CACHE = os.environ.get("FRAME_CACHE")
+
+def openInput(input, props=[], cache: str = None):
+  # A directory is read as a sequence of images, everything else is handled by OpenCV.
+  # A video file is read from its frame store when there is a cache directory.
+  cache = cache or FRAME_CACHE
+
+  if isinstance(input, str) and os.path.isdir(input):
+    input = ImageDirectory(input)
+  elif isinstance(input, str) and os.path.isfile(input) and cache:
+    input = FrameStore.open(input, cache)
+  else:
+    input = cv.VideoCapture(input)
 
   for prop in props:
     input.set(prop[0], prop[1])
@@ -31,23 +52,234 @@ def openInput(input, props=[]):
   if not input.isOpened():
     errorAndExit("Cannot open camera")
 
+  # Record at the frame rate of the input, a camera or image directory without one records at the default.
+  if RECORDER is not None and RECORDER.fps is None and input.get(cv.CAP_PROP_FPS) > 0:
+    RECORDER.fps = input.get(cv.CAP_PROP_FPS)
+
   return input
 
+# Reads the images in a directory in name order, with the same interface as a VideoCapture.
+class ImageDirectory:
+  def __init__(self, path: str):
+    self.files = sorted(os.path.join(path, file) for file in os.listdir(path) if file.lower().endswith(IMAGE_EXTENSIONS))
+    self.position = 0
+
+  def read(self, image=None):
+    if self.position >= len(self.files):
+      return False, None
+
+    frame = cv.imread(self.files[self.position])
+    self.position += 1
+
+    # Copy into the given image like VideoCapture does, when the size matches.
+    if frame is not None and image is not None and image.shape == frame.shape:
+      image[...] = frame
+      frame = image
+
+    return frame is not None, frame
+
+  def isOpened(self) -> bool:
+    return len(self.files) > 0
+
+  def get(self, prop):
+    if prop == cv.CAP_PROP_POS_FRAMES:
+      return self.position
+    if prop == cv.CAP_PROP_FRAME_COUNT:
+      return len(self.files)
+    return 0
+
+  def set(self, prop, value) -> bool:
+    if prop == cv.CAP_PROP_POS_FRAMES:
+      self.position = int(value)
+      return True
+    return False
+
+  def release(self):
+    self.files = []
+
+# The decoded frames of a video file in a raw file on disk, with the same interface as a VideoCapture.
+# The video is decoded once, later runs and seeks read the frames from the memory mapped file,
+# which costs a copy instead of decoding. A frame takes width * height * 3 bytes, so the store of a
+# long video at full HD takes a lot of disk space.
+# The index has the offset and shape of every frame, and is written last so a store without one is incomplete.
+class FrameStore:
+  def __init__(self, path: str):
+    index = np.load(path + ".index.npz")
+    self.offsets = index["offsets"]
+    self.shapes = index["shapes"]
+    self.fps = float(index["fps"])
+    self.data = np.memmap(path, np.uint8, "r") if self.offsets[-1] > 0 else np.empty(0, np.uint8)
+    self.position = 0
+    self.frame = None
+
+  # Open the store of a video in the cache directory, decodes the video into it first when there is none.
+  # The name of the store contains the size and modification time of the video, a changed video gets a new store.
+  @staticmethod
+  def open(video: str, cache: str):
+    info = os.stat(video)
+    name = f"{os.path.splitext(os.path.basename(video))[0]}-{info.st_size:x}-{info.st_mtime_ns:x}.frames"
+    path = os.path.join(cache, name)
+
+    if not os.path.isfile(path + ".index.npz"):
+      os.makedirs(cache, exist_ok=True)
+      FrameStore.decode(video, path)
+
+    return FrameStore(path)
+
+  # Decode every frame of a video into a store. Written to temporary files first,
+  # so an interrupted run or another process decoding the same video never leaves a broken store behind.
+  @staticmethod
+  def decode(video: str, path: str):
+    input = cv.VideoCapture(video)
+    if not input.isOpened():
+      errorAndExit("Cannot open camera")
+
+    print(f"Decoding {video} into {path}", file=sys.stderr)
+    temporary = f"{path}.{os.getpid()}"
+    # The first offset is the start of the first frame, the last one the end of the last frame.
+    offsets = [0]
+    shapes = []
+
+    with open(temporary, "wb") as file:
+      while True:
+        grabbed, frame = input.read()
+        if not grabbed: break
+
+        file.write(frame.tobytes())
+        offsets.append(offsets[-1] + frame.nbytes)
+        shapes.append(frame.shape)
+
+    fps = input.get(cv.CAP_PROP_FPS)
+    input.release()
+
+    with open(temporary + ".index.npz", "wb") as file:
+      np.savez(file, offsets=np.array(offsets, np.int64), shapes=np.array(shapes, np.int32).reshape(-1, 3), fps=fps)
+    os.replace(temporary, path)
+    os.replace(temporary + ".index.npz", path + ".index.npz")
+
+  def grab(self) -> bool:
+    if self.position >= len(self.shapes):
+      self.frame = None
+      return False
+
+    start, end = self.offsets[self.position:self.position + 2]
+    self.frame = self.data[start:end].reshape(self.shapes[self.position])
+    self.position += 1
+    return True
+
+  def retrieve(self, image=None):
+    if self.frame is None:
+      return False, None
+
+    # Copy out of the memory map, the file is read only and the scripts draw on the frames.
+    # Copy into the given image like VideoCapture does, when the size matches.
+    if image is None or image.shape != self.frame.shape:
+      image = np.empty(self.frame.shape, np.uint8)
+
+    image[...] = self.frame
+    return True, image
+
+  def read(self, image=None):
+    self.grab()
+    return self.retrieve(image)
+
+  def isOpened(self) -> bool:
+    return self.offsets is not None
+
+  def get(self, prop):
+    if prop == cv.CAP_PROP_POS_FRAMES:
+      return self.position
+    if prop == cv.CAP_PROP_FRAME_COUNT:
+      return len(self.shapes)
+    if prop == cv.CAP_PROP_FPS:
+      return self.fps
+    if prop == cv.CAP_PROP_POS_MSEC:
+      return self.position * 1000 / self.fps if self.fps > 0 else 0
+    if prop in (cv.CAP_PROP_FRAME_WIDTH, cv.CAP_PROP_FRAME_HEIGHT) and len(self.shapes) > 0:
+      return self.shapes[0][1 if prop == cv.CAP_PROP_FRAME_WIDTH else 0]
+    return 0
+
+  def set(self, prop, value) -> bool:
+    if prop == cv.CAP_PROP_POS_FRAMES:
+      self.position = min(max(int(value), 0), len(self.shapes))
+      return True
+    return False
+
+  def release(self):
+    self.offsets = None
+    self.shapes = []
+    self.data = None
+    self.frame = None
+
+
+## CIRCLES
+# A circle found by a detector, the detectors return a structured array with a row per circle.
+# colors has room for 2 BGR colors, colorCount is the number of colors the detector found.
+# id is the id of the circle when it is followed over the frames by a tracker, -1 otherwise.
+CIRCLE = np.dtype([
+  ("x", np.int32),
+  ("y", np.int32),
+  ("radius", np.int32),
+  ("colors", np.uint8, (2, 3)),
+  ("colorCount", np.uint8),
+  ("id", np.int32)
+])
+
+# Build the circles from the output of HoughCircles, or from rows of x, y and radius, scaled by ratio.
+# The output of HoughCircles is rounded to whole pixels, None gives no circles.
+def toCircles(circles, ratio: int = 1):
+  if circles is None: return np.empty(0, CIRCLE)
+
+  rows = np.asarray(circles).reshape(-1, 3)
+  if rows.dtype.kind == "f":
+    rows = np.uint16(np.around(rows))
+
+  result = np.zeros(len(rows), CIRCLE)
+  result["x"], result["y"], result["radius"] = (rows * ratio).T
+  result["id"] = -1
+  return result
+
+# The x, y and radius of the circles as rows, like the color functions take them.
+def getRows(circles):
+  return np.stack((circles["x"], circles["y"], circles["radius"]), 1)
+
+# The x, y, radius and colors of every circle as plain Python values, which is what drawing with OpenCV takes.
+def toTuples(circles):
+  return zip(circles["x"].tolist(), circles["y"].tolist(), circles["radius"].tolist(), circles["colors"].tolist())
+
+# Set the colors of the circles, given as a BGR color per circle or as 2 BGR colors per circle.
+def setColors(circles, colors):
+  if len(circles) == 0: return
+
+  colors = np.asarray(colors).reshape(len(circles), -1, 3)
+  circles["colors"][:, :colors.shape[1]] = colors
+  circles["colorCount"] = colors.shape[1]
+
 
 ## OUTPUT
 def setWindowName(name: str):
   global WINDOW_NAME
   WINDOW_NAME = name
-  cv.namedWindow(WINDOW_NAME)
+  runOnOutput(cv.namedWindow, WINDOW_NAME)
 
-def drawTitle(frame, title):
-  cv.putText(frame, title, (60, 40), cv.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 1, cv.LINE_AA)
+def drawTitle(frame, title, scale: float = 1):
+  cv.putText(frame, title, (round(60 * scale), round(40 * scale)), cv.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 255), 1, cv.LINE_AA)
 
 def drawFPS(frame, duration: int):
-  fps = str(round(1000 / duration))
+  # A frame that took no work, like a static frame with motion gating, can take less than a millisecond.
+  fps = str(round(1000 / max(duration, 1)))
   cv.putText(frame, fps, (frame.shape[1] - 60, 40), cv.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 1, cv.LINE_AA)
 
 def show(img, delay: int = 1) -> bool:
+  # Hand a copy of the frame to the output thread when there is one, the frames shown so far tell whether to stop.
+  if OUTPUT is not None:
+    OUTPUT.put(showNow, img.copy(), delay)
+    return not OUTPUT.closed
+
+  return showNow(img, delay)
+
+# Show a frame on the calling thread and handle the events of the window.
+def showNow(img, delay: int = 1) -> bool:
   cv.imshow(WINDOW_NAME, img)
 
   # Return false if Q is pressed.
@@ -59,6 +291,416 @@ def show(img, delay: int = 1) -> bool:
 
   return True
 
+# Close the windows, after the output thread is done with the frames it was given.
+def closeWindows():
+  runOnOutput(cv.destroyAllWindows)
+
+  if OUTPUT is not None:
+    OUTPUT.close()
+
+# Run a function that sets up or closes the windows, like creating the trackbars, on the output thread when there is one.
+# Several HighGUI backends only handle the windows on the thread that created them.
+def runOnOutput(function, *args):
+  if OUTPUT is not None:
+    OUTPUT.put(function, *args, keep=True)
+  else:
+    function(*args)
+
+
+## OUTPUT THREAD
+# Runs the output of the frames, None when the output runs on the thread of the caller.
+OUTPUT = None
+
+# Runs the output of the frames, like showing, recording and exporting, on its own thread
+# so a window that is slow to draw or a slow writer doesn't hold up the detection.
+# When the thread can't keep up, the oldest queued output is dropped,
+# or with lossless the caller waits until there is room, like the LOSSLESS policy of capture.py.
+class OutputThread:
+  def __init__(self, size: int = 2, lossless: bool = False):
+    self.tasks = collections.deque()
+    self.size = size
+    self.lossless = lossless
+    self.dropped = 0
+    # Set when an output returned false, like showNow when Q is pressed or the window is closed.
+    self.closed = False
+    self.stopped = False
+    self.condition = threading.Condition()
+    self.thread = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+
+  def _run(self):
+    while True:
+      with self.condition:
+        while len(self.tasks) == 0 and not self.stopped:
+          self.condition.wait()
+
+        if len(self.tasks) == 0: return
+        function, args, keep = self.tasks.popleft()
+        # Wake up a caller that waits for room.
+        self.condition.notify_all()
+
+      try:
+        if function(*args) is False:
+          self._closeOutput()
+      except BaseException:
+        # Stop the caller too instead of queueing output nobody handles.
+        self._closeOutput()
+        raise
+
+  # Drop the queued output, showing more frames would open the window again after it was closed.
+  def _closeOutput(self):
+    with self.condition:
+      self.closed = True
+      self.tasks.clear()
+
+  # Queue a function to run on the output thread with the given arguments.
+  # The arguments are used later, so pass a copy of anything the caller will change.
+  # With keep the function is never dropped and also runs after the window was closed, like creating or destroying the window.
+  def put(self, function, *args, keep: bool = False):
+    with self.condition:
+      # The window is closed, so there is nothing left to show.
+      if self.closed and not keep: return
+
+      if keep:
+        pass
+      elif self.lossless:
+        while len(self.tasks) >= self.size and not self.closed:
+          self.condition.wait()
+        if self.closed: return
+      elif len(self.tasks) >= self.size:
+        # Drop the oldest output that may be dropped.
+        dropped = next((task for task in self.tasks if not task[2]), None)
+        if dropped is not None:
+          self.tasks.remove(dropped)
+          self.dropped += 1
+
+      self.tasks.append((function, args, keep))
+      self.condition.notify_all()
+
+  # Wait until the queued output is done and stop the thread.
+  def close(self):
+    with self.condition:
+      self.stopped = True
+      self.condition.notify_all()
+
+    self.thread.join()
+
+# Run the output on its own thread, set the ASYNC_OUTPUT environment variable to enable it for a script.
+# The windows and trackbars are created, shown and destroyed on that thread.
+# Some platforms, like macOS, only allow windows on the main thread, so it's not the default.
+def enableOutputThread(size: int = 2):
+  global OUTPUT
+  OUTPUT = OutputThread(size)
+  atexit.register(OUTPUT.close)
+
+if os.environ.get("ASYNC_OUTPUT"):
+  enableOutputThread()
+
+
+## RECORDING
+# Records the frames and the circles, None when not recording.
+RECORDER = None
+
+# One row of the detection log, a circle found in a frame.
+# The time is in milliseconds since the epoch, colors the detector didn't find are black.
+DETECTION = np.dtype([
+  ("frame", np.int64),
+  ("time", np.int64),
+  ("x", np.int32),
+  ("y", np.int32),
+  ("radius", np.int32),
+  ("colors", np.uint8, (2, 3))
+])
+
+# Writes the frames to a video on a background thread and the circles to a detection log next to it,
+# a .npy file with a DETECTION row per circle that np.load reads as one structured array.
+# The log is written while recording, so a long recording doesn't have to fit in memory.
+# No frame is dropped, so the frame of a row is the number of its frame in the video. When the video writer
+# can't keep up for longer than the queue of frames lasts, the detection waits for it.
+class Recorder:
+  # The size of the .npy header, big enough for any number of rows, so it can be rewritten in place when closing.
+  HEADER_SIZE = 256
+  # The frame rate of the video when it isn't given and the input doesn't have one.
+  DEFAULT_FPS = 30
+
+  def __init__(self, path: str, fps: float = None, fourcc: str = "MJPG", size: int = 64):
+    self.path = path
+    self.fps = fps
+    self.fourcc = fourcc
+    self.writer = None
+    self.output = OutputThread(size, lossless=True)
+    self.frames = 0
+    self.rows = 0
+    self.log = open(os.path.splitext(path)[0] + ".npy", "wb")
+    self.writeHeader()
+
+  # Record a frame and the circles found in it.
+  def write(self, frame, circles=None):
+    self.output.put(self.writeFrame, frame.copy())
+
+    if circles is None:
+      circles = np.empty(0, CIRCLE)
+
+    rows = np.zeros(len(circles), DETECTION)
+    rows["frame"] = self.frames
+    rows["time"] = millis()
+    for name in ("x", "y", "radius", "colors"):
+      rows[name] = circles[name]
+
+    self.log.write(rows.tobytes())
+    self.frames += 1
+    self.rows += len(rows)
+
+  def writeFrame(self, frame):
+    # The size of the video is only known with the first frame.
+    if self.writer is None:
+      fps = self.fps or self.DEFAULT_FPS
+      self.writer = cv.VideoWriter(self.path, cv.VideoWriter_fourcc(*self.fourcc), fps, (frame.shape[1], frame.shape[0]))
+
+    self.writer.write(frame)
+
+  def writeHeader(self):
+    header = {"descr": np.lib.format.dtype_to_descr(DETECTION), "fortran_order": False, "shape": (self.rows,)}
+    header = repr(header).encode("latin1")
+    # The magic string, the version and the length of the header, the header itself ends with a newline.
+    self.log.write(b"\x93NUMPY\x01\x00" + np.uint16(self.HEADER_SIZE - 10).tobytes())
+    self.log.write(header.ljust(self.HEADER_SIZE - 11) + b"\n")
+
+  # Write the queued frames and the number of rows of the log, does nothing when already closed.
+  def close(self):
+    if self.log.closed: return
+
+    self.output.close()
+    if self.writer is not None:
+      self.writer.release()
+
+    self.log.seek(0)
+    self.writeHeader()
+    self.log.close()
+
+# Record the frames to a video and the circles to a detection log, set the RECORD environment variable
+# to the path of the video to enable it for a script. Without a frame rate the one of the input is used.
+def enableRecording(path: str, fps: float = None):
+  global RECORDER
+  RECORDER = Recorder(path, fps)
+  atexit.register(RECORDER.close)
+
+# Record a frame and its circles when recording.
+def record(frame, circles=None):
+  if RECORDER is not None:
+    RECORDER.write(frame, circles)
+
+if os.environ.get("RECORD"):
+  enableRecording(os.environ["RECORD"])
+
+
+## CACHING
+# Keeps the results of expensive functions, like the preprocessing of a frame, up to a memory cap.
+# When the cap is reached the results that were used the longest ago are removed first.
+class Cache:
+  def __init__(self, maxBytes: int = 1024 * 1024 * 1024):
+    self.maxBytes = maxBytes
+    self.entries = collections.OrderedDict()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+
+  # Get the result for a key, compute is called when it isn't kept.
+  # The arrays in the result are copied, so compute can return buffers that are reused. Don't change the result.
+  def get(self, key, compute):
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return self.entries[key][0]
+
+    self.misses += 1
+    value = copyArrays(compute())
+    size = getSize(value)
+    # A result larger than the cap would remove everything else and then itself.
+    if size > self.maxBytes: return value
+
+    self.entries[key] = (value, size)
+    self.bytes += size
+
+    while self.bytes > self.maxBytes:
+      removed, removedSize = self.entries.popitem(last=False)[1]
+      self.bytes -= removedSize
+
+    return value
+
+  def clear(self):
+    self.entries.clear()
+    self.bytes = 0
+
+# Copy the arrays in a value, also in tuples and lists.
+def copyArrays(value):
+  if isinstance(value, np.ndarray): return value.copy()
+  if isinstance(value, (tuple, list)): return tuple(map(copyArrays, value))
+  return value
+
+# The number of bytes of the arrays in a value.
+def getSize(value):
+  if isinstance(value, np.ndarray): return value.nbytes
+  if isinstance(value, (tuple, list)): return sum(map(getSize, value))
+  return 0
+
+
+## QUALITY
+# Lowers the quality of the detection when the frames take longer than the target frame rate allows,
+# and raises it again when there is time left. None when the quality is fixed.
+SCHEDULER = None
+
+# The quality levels of the scheduler, from the best to the fastest. The cheap settings that don't change
+# the circles go first. The detectors apply the settings of the current level on top of their own.
+# levels: The least number of levels of the coarse to fine circle search, see hough.findCirclesCoarseToFine.
+#         1 level is left out, it's slower than searching the whole image for pool-ball-detection.py.
+# subsample: Factor on the pixels skipped when getting the colors of the circles.
+# preview: Factor on the frames between updates of the intermediate images, 0 only shows the output.
+# A larger dp for HoughCircles is not one of the settings, it finds a lot more false circles unless the
+# accumulator threshold goes up as well and then the circles of the circle detection scripts are lost.
+QUALITY_LEVELS = [
+  { "levels": 0, "subsample": 1, "preview": 1 },
+  { "levels": 0, "subsample": 2, "preview": 2 },
+  { "levels": 0, "subsample": 4, "preview": 0 },
+  { "levels": 2, "subsample": 4, "preview": 0 },
+  { "levels": 3, "subsample": 4, "preview": 0 }
+]
+
+# Picks the quality level from the measured loop time of the last frames, the time util.drawFPS shows.
+# The quality is lowered when the median is above the budget of a frame by more than slower,
+# and raised when it's below the budget by more than faster. Between the two nothing changes,
+# and after a change the frames of a whole window are measured at the new level first.
+# When a raised level turns out to be too slow right away, the next raise waits twice as long, so the
+# quality doesn't keep switching between a level that is too slow and one that is fast enough.
+# Every change is printed and kept in decisions.
+class QualityScheduler:
+  def __init__(self, fps: float, levels=QUALITY_LEVELS, window: int = 30, slower: float = 0.1, faster: float = 0.3):
+    self.budget = 1000 / fps
+    self.levels = levels
+    self.window = window
+    self.slower = slower
+    self.faster = faster
+    self.durations = collections.deque(maxlen=window)
+    self.level = 0
+    self.frames = 0
+    self.raiseAfter = window
+    self.raised = False
+    self.decisions = []
+
+  # The settings of the current level.
+  def get(self):
+    return self.levels[self.level]
+
+  # Add the duration of a frame in milliseconds, returns the settings for the next frame.
+  def update(self, duration: float):
+    self.durations.append(duration)
+    self.frames += 1
+    if len(self.durations) < self.window: return self.get()
+
+    median = float(np.median(self.durations))
+    if median > self.budget * (1 + self.slower) and self.level < len(self.levels) - 1:
+      # Lowering in the first window after a raise means the raised level is too slow, try it less often.
+      self.raiseAfter = min(self.raiseAfter * 2, self.window * 32) if self.raised else self.window
+      self.change(self.level + 1, median)
+    elif median < self.budget * (1 - self.faster) and self.level > 0 and self.frames >= self.raiseAfter:
+      self.change(self.level - 1, median)
+    elif self.raised:
+      # The raised level keeps up, so the next raise doesn't have to wait longer.
+      self.raised = False
+      self.raiseAfter = self.window
+
+    return self.get()
+
+  def change(self, level: int, median: float):
+    decision = { "frame": self.frames, "from": self.level, "to": level, "fps": 1000 / max(median, 1e-3), "target": 1000 / self.budget }
+    self.decisions.append(decision)
+    print(f"Quality {decision['from']} -> {decision['to']} after {decision['frame']} frames, {decision['fps']:.1f} fps for a target of {decision['target']:.1f}", file=sys.stderr)
+
+    self.raised = level < self.level
+    self.level = level
+    self.frames = 0
+    self.durations.clear()
+
+# Adapt the quality to a target frame rate, set the TARGET_FPS environment variable to enable it for a script.
+def enableQualityScheduler(fps: float):
+  global SCHEDULER
+  SCHEDULER = QualityScheduler(fps)
+
+# The quality settings for the next frame, the best quality when there is no scheduler.
+def getQuality():
+  return QUALITY_LEVELS[0] if SCHEDULER is None else SCHEDULER.get()
+
+# Pass the loop time of a frame in milliseconds to the scheduler.
+def updateQuality(duration: float):
+  if SCHEDULER is not None:
+    SCHEDULER.update(duration)
+
+if os.environ.get("TARGET_FPS"):
+  enableQualityScheduler(float(os.environ["TARGET_FPS"]))
+
+
+## PROFILING
+# The durations of the last frames per stage in nanoseconds, None when profiling is disabled.
+PROFILE = None
+# Returned for every stage when profiling is disabled, so a disabled stage costs next to nothing.
+NO_STAGE = contextlib.nullcontext()
+
+# Start collecting stage durations, set the PROFILE environment variable to enable it for a script.
+def enableProfiling(samples: int = 1000, report: bool = True):
+  global PROFILE
+  PROFILE = collections.defaultdict(lambda: collections.deque(maxlen=samples))
+
+  # Print the report when the script exits.
+  if report:
+    atexit.register(printProfile)
+
+# Time a stage of the processing with a with statement.
+def stage(name: str):
+  if PROFILE is None: return NO_STAGE
+  return Stage(name)
+
+class Stage:
+  def __init__(self, name: str):
+    self.name = name
+
+  def __enter__(self):
+    self.begin = time.perf_counter_ns()
+
+  def __exit__(self, *args):
+    PROFILE[self.name].append(time.perf_counter_ns() - self.begin)
+
+# Time every call of a function as a stage.
+def timed(name: str):
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with stage(name):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorator
+
+# Get the 50th, 95th and 99th percentile duration in milliseconds per stage.
+def getProfile():
+  if PROFILE is None: return {}
+  return { name: np.percentile(durations, (50, 95, 99)) / 1000000 for name, durations in PROFILE.items() if len(durations) > 0 }
+
+def drawProfile(frame):
+  for i, (name, percentiles) in enumerate(getProfile().items()):
+    text = f"{name}: {percentiles[0]:.1f} / {percentiles[1]:.1f} / {percentiles[2]:.1f} ms"
+    cv.putText(frame, text, (frame.shape[1] - 420, 80 + i * 25), cv.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 1, cv.LINE_AA)
+
+def printProfile():
+  profile = getProfile()
+  if len(profile) == 0: return
+
+  # Print to stderr so the report doesn't end up between the results of a headless run.
+  print(f"{'stage':12} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)", file=sys.stderr)
+  for name, percentiles in profile.items():
+    print(f"{name:12} {percentiles[0]:8.2f} {percentiles[1]:8.2f} {percentiles[2]:8.2f}", file=sys.stderr)
+
+if os.environ.get("PROFILE"):
+  enableProfiling()
+
 
 ## ERRORS
 def errorAndExit(message: str):